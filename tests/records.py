@@ -0,0 +1,26 @@
+# Raw API records shaped like Venmo's responses.
+
+
+def user(user_id, username):
+  return dict(id=user_id, username=username, first_name=username,
+      last_name='L', display_name=username.title(), about='',
+      profile_picture_url='', friends_count=1, is_group=False,
+      is_active=True, trust_request=None, is_blocked=False, identity=None,
+      date_joined='2015-01-01T00:00:00', friend_status='friend',
+      is_payable=True, identity_type='personal')
+
+
+def payment(payment_id, when, note, amount=12.5, action='pay',
+    status='settled', actor=None, target=None):
+  return dict(id=payment_id, status=status, action=action,
+      actor=actor or user('222', 'alice'), note=note, amount=amount,
+      target=dict(type='user', phone=None, email=None,
+          redeemable_target=None, user=target or user('111', 'me')),
+      audience='private', date_created=when, date_completed=when,
+      date_authorized=None, date_reminded=None,
+      external_wallet_payment_info=None)
+
+
+def story(story_id, when, note, amount=12.5):
+  return dict(type='payment', id=story_id, datetime_created=when, note=note,
+      amount=amount, payment=payment(f'p{story_id}', when, note, amount))
@@ -0,0 +1,36 @@
+import pytest
+
+from venmo_client import aggregate
+from venmo_client import model
+
+from records import payment
+
+
+def items(*notes):
+  return [model.Payment.new(**payment(f'p{i}', '2021-01-01T00:00:00', note))
+      for i, note in enumerate(notes)]
+
+
+def test_aggregator_requires_every_method():
+
+  class Partial(aggregate.Aggregator):
+
+    def add(self, item):
+      pass
+
+  with pytest.raises(TypeError):
+    Partial()
+
+
+def test_group_by_merge_leaves_other_untouched():
+  template = aggregate.GroupBy(aggregate.note, aggregate.Count())
+  left = template.empty()
+  right = template.empty()
+  for item in items('rent', 'rent'):
+    right.add(item)
+  left.merge(right)
+  for item in items('rent', 'food'):
+    left.add(item)
+  assert left.result() == dict(rent=3, food=1)
+  assert right.result() == dict(rent=2)
+  assert left.groups['rent'] is not right.groups['rent']
@@ -0,0 +1,96 @@
+import datetime
+import json
+
+import pytest
+import requests
+
+from venmo_client import client
+
+from records import story
+
+
+class FakeStories:
+  # Serves `/stories` newest first, paged by `before_id`, and fails every
+  # request after `fail_after` of them.
+
+  def __init__(self):
+    self.stories = []
+    self.requests = 0
+    self.fail_after = None
+
+  def add(self, count):
+    start = datetime.datetime(2021, 1, 1)
+    for _ in range(count):
+      i = len(self.stories)
+      when = (start + datetime.timedelta(hours=i)).isoformat()
+      self.stories.insert(0, story(f's{i}', when, 'dinner'))
+
+  def __call__(self, url, method, *, headers={}, payload={}, params={}):
+    self.requests += 1
+    if self.fail_after is not None and self.requests > self.fail_after:
+      raise requests.ConnectionError('network down')
+    ids = [record['id'] for record in self.stories]
+    start = ids.index(params['before_id']) + 1 if params.get('before_id') else 0
+    limit = int(params['limit'])
+    data = self.stories[start:start + limit]
+    pagination = {}
+    if start + limit < len(self.stories):
+      pagination['next'] = (f'https://venmo/stories?limit={limit}'
+          f'&before_id={data[-1]["id"]}')
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(
+        dict(data=data, pagination=pagination)).encode('utf-8')
+    return response
+
+
+@pytest.fixture
+def venmo(tmp_path, monkeypatch):
+  venmo = client.VenmoClient(tmp_path / 'config')
+  venmo.auth_config.save('111', 'token')
+  venmo.fake = FakeStories()
+  monkeypatch.setattr(venmo, '_make_request', venmo.fake)
+  return venmo
+
+
+def archived(venmo):
+  return {transaction.id for transaction in
+      venmo.archive.between('1970-01-01', '9999-12-31')}
+
+
+def test_sync_archives_everything(venmo):
+  venmo.fake.add(100)
+  assert venmo.sync_archive(limit=10) == 100
+  assert venmo.archive.complete
+  venmo.fake.add(5)
+  assert venmo.sync_archive(limit=10) == 5
+  assert venmo.sync_archive(limit=10) == 0
+  assert len(archived(venmo)) == 105
+
+
+def test_interrupted_backfill_resumes(venmo):
+  venmo.fake.add(100)
+  venmo.fake.fail_after = 3
+  with pytest.raises(requests.ConnectionError):
+    venmo.sync_archive(limit=10)
+  assert len(archived(venmo)) == 30
+  venmo.fake.fail_after = None
+  assert venmo.sync_archive(limit=10) == 70
+  assert archived(venmo) == {f's{i}' for i in range(100)}
+
+
+def test_interrupted_sync_of_newer_stories_leaves_no_hole(venmo):
+  venmo.fake.add(100)
+  venmo.sync_archive(limit=10)
+  assert venmo.archive.complete
+  venmo.fake.add(100)
+  venmo.fake.fail_after = venmo.fake.requests + 5
+  with pytest.raises(requests.ConnectionError):
+    venmo.sync_archive(limit=10)
+  assert len(archived(venmo)) == 150
+  # More stories arrive before the next sync.
+  venmo.fake.add(10)
+  venmo.fake.fail_after = None
+  assert venmo.sync_archive(limit=10) == 60
+  assert archived(venmo) == {f's{i}' for i in range(210)}
+  assert venmo.archive.crawl is None
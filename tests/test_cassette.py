@@ -0,0 +1,71 @@
+import json
+
+import pytest
+import requests
+
+from venmo_client import cassette
+
+from records import payment
+
+
+class FakeTransport:
+
+  def __init__(self, body):
+    self.body = body
+
+  def send(self, request, **kwargs):
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps(self.body).encode('utf-8')
+    return response
+
+
+def prepare(url):
+  return requests.Request('GET', url).prepare()
+
+
+def test_salt_is_created_once_per_config_dir(tmp_path):
+  salt = cassette.load_salt(tmp_path / 'config')
+  assert len(salt) == 32
+  assert cassette.load_salt(tmp_path / 'config') == salt
+  assert cassette.load_salt(tmp_path / 'other') != salt
+
+
+def test_pseudonyms_are_keyed_and_stable():
+  scrubber = cassette.Scrubber(b'salt')
+  name = scrubber.pseudonym('username', 'alice')
+  assert name.startswith('username-') and 'alice' not in name
+  assert scrubber.pseudonym('username', name) == name
+  assert cassette.Scrubber(b'salt').pseudonym('username', 'alice') == name
+  # Without the salt, hashing a list of candidate usernames finds nothing.
+  assert cassette.Scrubber(b'pepper').pseudonym('username', 'alice') != name
+
+
+def test_notes_are_pseudonymized_unless_kept():
+  record = payment('p1', '2021-01-01T00:00:00', 'rent for alice')
+  scrubbed = cassette.Scrubber(b'salt').scrub(record)
+  assert scrubbed['note'].startswith('note-')
+  assert scrubbed['actor']['username'].startswith('username-')
+  kept = cassette.Scrubber(b'salt', keep_notes=True).scrub(record)
+  assert kept['note'] == 'rent for alice'
+
+
+def test_replay_needs_the_recording_salt(tmp_path):
+  path = tmp_path / 'cassette.jsonl'
+  record = payment('p1', '2021-01-01T00:00:00', 'rent')
+  url = 'http://venmo/v1/users/alice'
+  recorder = cassette.Recorder(path, b'salt',
+      transport=FakeTransport(dict(data=record)), user_id='111')
+  recorder.send(prepare(url))
+  recorder.close()
+  content = path.read_text()
+  assert 'alice' not in content and 'rent' not in content
+  assert b'salt'.hex() not in content
+
+  replayer = cassette.Replayer(path, b'salt')
+  body = replayer.send(prepare(url)).json()
+  assert body['data']['id'] == 'p1'
+  other = cassette.Replayer(path, b'pepper')
+  assert other.user_id == replayer.user_id
+  with pytest.raises(ValueError):
+    other.send(prepare(url))
@@ -0,0 +1,131 @@
+import http.server
+import json
+import threading
+import urllib.parse as urlparse
+
+import pytest
+
+from venmo_client import client
+
+from records import payment, user
+
+PAYMENTS = [payment(f'p{i}', f'2021-01-01T{i // 60 % 24:02}:{i % 60:02}:00',
+    'dinner', action='charge', status='pending') for i in range(300)]
+THREADS = 16
+ROUNDS = 10
+LIMIT = 120
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, *args):
+    pass
+
+  def do_GET(self):
+    server = self.server
+    # `requests` sends a JSON body even on GET; it has to be read for the
+    # connection to be reused.
+    self.rfile.read(int(self.headers.get('Content-Length') or 0))
+    url = urlparse.urlparse(self.path)
+    params = dict(urlparse.parse_qsl(url.query))
+    with server.lock:
+      server.connections.add(self.client_address)
+      server.requests[url.path] = server.requests.get(url.path, 0) + 1
+    if url.path.endswith('/me'):
+      body = dict(data=dict(user=user('111', 'me'), balance='3.50'))
+    else:
+      start = int(params.get('before') or 0)
+      limit = int(params['limit'])
+      pagination = {}
+      if start + limit < len(PAYMENTS):
+        pagination['next'] = (f'http://venmo/v1/payments?action=charge'
+            f'&before={start + limit}&limit={limit}')
+      body = dict(data=PAYMENTS[start:start + limit], pagination=pagination)
+    content = json.dumps(body).encode('utf-8')
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+
+class Server(http.server.ThreadingHTTPServer):
+  # Every thread may connect at once.
+  request_queue_size = THREADS * 4
+
+
+@pytest.fixture
+def server():
+  server = Server(('127.0.0.1', 0), Handler)
+  server.daemon_threads = True
+  server.lock = threading.Lock()
+  server.connections = set()
+  server.requests = {}
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  yield server
+  server.shutdown()
+  server.server_close()
+
+
+def test_threads_share_one_client(server, tmp_path):
+  venmo = client.VenmoClient(tmp_path / 'config',
+      base_url=f'http://127.0.0.1:{server.server_port}/v1', timeout=10)
+  venmo.auth_config.save('111', 'token')
+  expected = [record['id'] for record in PAYMENTS[:LIMIT]]
+  results, errors = [], []
+
+  def work():
+    try:
+      for _ in range(ROUNDS):
+        balance = venmo.balance()
+        ids = [item.id for item in venmo.payments(limit=LIMIT)]
+        results.append((balance, ids))
+    except Exception as e:
+      errors.append(e)
+
+  threads = [threading.Thread(target=work) for _ in range(THREADS)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join(timeout=60)
+  assert not any(thread.is_alive() for thread in threads)
+  assert errors == []
+  assert len(results) == THREADS * ROUNDS
+  assert all(result == (3.5, expected) for result in results)
+
+  stats = venmo.stats()
+  singleflight = stats['singleflight']
+  assert singleflight['inflight'] == 0
+  assert singleflight['hits'] + singleflight['misses'] == THREADS * ROUNDS
+  assert singleflight['misses'] == server.requests['/v1/me']
+  payments = stats['page_size']['payments']
+  assert payments['failures'] == 0
+  assert payments['pages'] == server.requests['/v1/payments']
+  # Connections are kept alive and reused across requests.
+  assert len(server.connections) < sum(server.requests.values())
+
+
+def test_login_does_not_hold_the_credentials_lock(tmp_path, monkeypatch):
+  venmo = client.VenmoClient(tmp_path / 'config')
+  prompting, answered = threading.Event(), threading.Event()
+
+  def login(username, password):
+    # Stands in for waiting on the user to type a two-factor code.
+    prompting.set()
+    answered.wait(10)
+    return dict(user=dict(id='111'), access_token='token')
+
+  monkeypatch.setattr(venmo, 'login', login)
+  thread = threading.Thread(
+      target=lambda: venmo.authenticate(username='me', password='secret'))
+  thread.start()
+  assert prompting.wait(10)
+  acquired = venmo.auth_config.lock.acquire(timeout=1)
+  if acquired:
+    venmo.auth_config.lock.release()
+  answered.set()
+  thread.join(10)
+  assert acquired
+  assert venmo.user_id == '111'
@@ -0,0 +1,19 @@
+from venmo_client import filters
+
+from records import story
+
+
+def test_eq_and_is_in_follow_dotted_paths():
+  record = story('s1', '2021-01-01T12:00:00', 'rent')
+  assert filters.eq('type', 'payment')(record)
+  assert filters.eq('payment.status', 'settled')(record)
+  assert filters.eq('payment.target.user.username', 'me')(record)
+  assert filters.is_in('payment.status', ['pending', 'settled'])(record)
+  assert not filters.is_in('payment.status', ['pending'])(record)
+
+
+def test_missing_path_is_none():
+  record = story('s1', '2021-01-01T12:00:00', 'rent')
+  assert filters.eq('payment.refund.id', None)(record)
+  assert filters.eq('note.length', None)(record)
+  assert not filters.eq('payment.refund.id', 'r1')(record)
@@ -0,0 +1,150 @@
+import datetime
+import threading
+import time
+
+import pytest
+import requests
+
+from venmo_client import model
+from venmo_client import outbox
+
+from records import payment, user
+
+
+class FakeClient:
+  # Records every charge it is asked to send, and lists them back newest
+  # first like `payments()`.
+  user_id = '111'
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.sent = []
+    self.fail = None
+    self.network_down = False
+
+  def request(self, note, username, amount):
+    if self.network_down:
+      raise requests.ConnectionError('network down')
+    if self.fail is not None:
+      raise self.fail
+    with self.lock:
+      payment_id = f'p{len(self.sent)}'
+      self.sent.append(payment(payment_id,
+          datetime.datetime.now(datetime.timezone.utc).isoformat(), note,
+          amount=amount, action='charge', status='pending',
+          actor=user('111', 'me'), target=user('222', username)))
+    # Sending is slow enough for concurrent workers to overlap.
+    time.sleep(0.01)
+    return dict(data=dict(payment=dict(id=payment_id)))
+
+  def payments(self, action='charge', limit=None):
+    if self.network_down:
+      raise requests.ConnectionError('network down')
+    with self.lock:
+      return [model.Payment.new(**raw) for raw in reversed(self.sent)]
+
+
+@pytest.fixture
+def fake():
+  return FakeClient()
+
+
+def make_outbox(tmp_path, fake, **kwargs):
+  kwargs.setdefault('backoff', 0.)
+  return outbox.Outbox(tmp_path / 'outbox.sqlite', fake, **kwargs)
+
+
+def test_sends_each_charge_once(tmp_path, fake):
+  box = make_outbox(tmp_path, fake)
+  keys = [box.charge(f'friend{i}', 5., 'rent') for i in range(20)]
+  box.drain(workers=8)
+  assert [box.get(key).state for key in keys] == ['done'] * 20
+  assert len(fake.sent) == 20
+
+
+def test_two_outboxes_claim_each_operation_once(tmp_path, fake):
+  # Stands in for two processes draining the same outbox.
+  first, second = make_outbox(tmp_path, fake), make_outbox(tmp_path, fake)
+  keys = [first.charge(f'friend{i}', 5., 'rent') for i in range(20)]
+  threads = [threading.Thread(target=box.drain, kwargs=dict(workers=4))
+      for box in (first, second)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join(30)
+  assert [first.get(key).state for key in keys] == ['done'] * 20
+  assert sorted(raw['target']['user']['username'] for raw in fake.sent) == (
+      sorted(f'friend{i}' for i in range(20)))
+
+
+def test_live_lease_is_left_alone(tmp_path, fake):
+  box = make_outbox(tmp_path, fake)
+  key = box.charge('bob', 5., 'rent')
+  claimed = box._claim()
+  assert claimed.key == key
+  # Opening the outbox again doesn't take over the claimed operation.
+  other = make_outbox(tmp_path, fake)
+  other.drain(workers=1)
+  assert other.get(key).state == 'sending'
+  assert fake.sent == []
+
+
+def test_expired_lease_is_verified_before_resending(tmp_path, fake):
+  box = make_outbox(tmp_path, fake)
+  key = box.charge('bob', 5., 'rent')
+  crashed = box._claim()
+  # The worker sent the charge and then died before recording it.
+  fake.request('rent', 'bob', 5.)
+  other = make_outbox(tmp_path, fake, lease=0.)
+  other.drain(workers=1)
+  op = other.get(key)
+  assert (op.state, op.payment_id) == ('done', 'p0')
+  assert len(fake.sent) == 1
+  # The crashed worker no longer holds the claim, so it can't overwrite it.
+  box._finish(crashed, 'failed', error='late')
+  assert other.get(key).state == 'done'
+
+
+def test_expired_lease_resends_when_nothing_went_through(tmp_path, fake):
+  box = make_outbox(tmp_path, fake)
+  key = box.charge('bob', 5., 'rent')
+  box._claim()
+  other = make_outbox(tmp_path, fake, lease=0.)
+  other.drain(workers=1)
+  assert other.get(key).state == 'done'
+  assert len(fake.sent) == 1
+
+
+def test_failed_key_can_be_enqueued_again(tmp_path, fake):
+  box = make_outbox(tmp_path, fake)
+  fake.fail = ValueError(400)
+  key = box.charge('bob', 5., 'rent', key='rent-bob')
+  box.drain(workers=1)
+  assert box.get(key).state == 'failed'
+  fake.fail = None
+  assert box.charge('bob', 5., 'rent', key='rent-bob') == key
+  assert box.get(key).attempts == 0
+  box.drain(workers=1)
+  assert box.get(key).state == 'done'
+  # Once done, enqueueing the key again is a no-op.
+  box.charge('bob', 5., 'rent', key='rent-bob')
+  box.drain(workers=1)
+  assert box.get(key).state == 'done'
+  assert len(fake.sent) == 1
+
+
+def test_network_down_gives_up_after_max_attempts(tmp_path, fake):
+  box = make_outbox(tmp_path, fake, max_attempts=3)
+  fake.network_down = True
+  key = box.charge('bob', 5., 'rent')
+  box.drain(workers=1)
+  op = box.get(key)
+  assert (op.state, op.attempts) == ('failed', 3)
+
+
+def test_unfinished_charges(tmp_path, fake):
+  box = make_outbox(tmp_path, fake)
+  key = box.charge('bob', 5., 'rent')
+  box._claim()
+  assert [op.key for op in box.unfinished_charges('bob', 5., 'rent')] == [key]
+  assert box.unfinished_charges('bob', 6., 'rent') == []
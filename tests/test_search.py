@@ -0,0 +1,29 @@
+import threading
+
+from venmo_client import client
+
+from records import story
+
+
+def make_client(tmp_path):
+  venmo = client.VenmoClient(tmp_path / 'config')
+  venmo.auth_config.save('111', 'token')
+  return venmo
+
+
+def test_first_search_on_empty_config_dir(tmp_path):
+  venmo = make_client(tmp_path)
+  results = []
+  thread = threading.Thread(
+      target=lambda: results.append(venmo.search('dinner')), daemon=True)
+  thread.start()
+  thread.join(timeout=10)
+  assert not thread.is_alive(), 'search deadlocked'
+  assert results == [[]]
+
+
+def test_search_backfills_from_archive(tmp_path):
+  venmo = make_client(tmp_path)
+  venmo.archive.add(story('s1', '2021-01-01T12:00:00', 'pizza night'))
+  results = venmo.search('pizza')
+  assert [result.id for result in results] == ['s1']
@@ -0,0 +1,105 @@
+import datetime
+
+import pytest
+
+from venmo_client import model
+from venmo_client import reconcile
+from venmo_client import statements
+from venmo_client import util
+
+from records import story
+
+START = datetime.datetime(2020, 1, 1)
+TODAY = datetime.date(2020, 4, 20)
+# Every nine hours from 2020-01-01, through the middle of April.
+STORIES = [story(f's{i}', (START + datetime.timedelta(hours=9 * i)).isoformat(),
+    'dinner', amount=1 + i % 7) for i in range(300)]
+
+
+def cents(raw):
+  return reconcile.signed_cents(model.Transaction.new(**raw), '111')
+
+
+class FakeStatements:
+  # Serves statements newest first, like the server may. `drift` is added
+  # to every end balance, so carried balances never add up.
+
+  def __init__(self, drift=0):
+    self.requests = []
+    self.drift = drift
+
+  def __call__(self, start, end):
+    self.requests.append((start, end))
+    day = lambda raw: raw['datetime_created'][:10]
+    before = [raw for raw in STORIES if day(raw) < start.isoformat()]
+    window = [raw for raw in STORIES
+        if start.isoformat() <= day(raw) <= end.isoformat()]
+    start_cents = 10000 + sum(map(cents, before))
+    end_cents = start_cents + sum(map(cents, window)) + self.drift
+    return dict(start_balance=f'{start_cents / 100:.2f}',
+        end_balance=f'{end_cents / 100:.2f}', transactions=window[::-1])
+
+
+def expected(start, end):
+  data = FakeStatements()(start, end)
+  return ([raw['id'] for raw in reversed(data['transactions'])],
+      (float(data['start_balance']), float(data['end_balance'])))
+
+
+def get(cache, start, end):
+  transactions, balances = cache.get(start, end, today=TODAY)
+  return [txn.id for txn in transactions], balances
+
+
+@pytest.mark.parametrize('start, end', [
+    (datetime.date(2020, 1, 10), datetime.date(2020, 3, 5)),
+    (datetime.date(2020, 2, 1), datetime.date(2020, 2, 29)),
+    (datetime.date(2020, 2, 3), datetime.date(2020, 4, 30)),
+])
+def test_assembles_any_range_in_one_request(tmp_path, start, end):
+  fetch = FakeStatements()
+  cache = statements.StatementCache(tmp_path, '111', fetch)
+  ids, balances = get(cache, start, end)
+  assert len(fetch.requests) == 1
+  want_ids, want_balances = expected(start, min(end, TODAY))
+  assert ids == want_ids
+  assert [util.to_cents(b) for b in balances] == (
+      [util.to_cents(b) for b in want_balances])
+
+
+def test_closed_months_are_served_from_disk(tmp_path):
+  fetch = FakeStatements()
+  statements.StatementCache(tmp_path, '111', fetch).get(
+      datetime.date(2020, 1, 1), datetime.date(2020, 4, 20), today=TODAY)
+  assert sorted(path.name for path in tmp_path.iterdir()) == [
+      '2020-01.json', '2020-02.json', '2020-03.json']
+  fetch.requests.clear()
+  cache = statements.StatementCache(tmp_path, '111', fetch)
+  start, end = datetime.date(2020, 1, 15), datetime.date(2020, 3, 10)
+  assert get(cache, start, end)[0] == expected(start, end)[0]
+  assert fetch.requests == []
+  # The current month is always fetched live.
+  get(cache, datetime.date(2020, 3, 15), datetime.date(2020, 4, 10))
+  assert fetch.requests == [(datetime.date(2020, 4, 1), TODAY)]
+
+
+def test_partitions_of_another_account_are_ignored(tmp_path):
+  fetch = FakeStatements()
+  window = (datetime.date(2020, 1, 1), datetime.date(2020, 1, 31))
+  statements.StatementCache(tmp_path, '111', fetch).get(*window, today=TODAY)
+  statements.StatementCache(tmp_path, '222', fetch).get(*window, today=TODAY)
+  assert len(fetch.requests) == 2
+
+
+def test_unbalanced_split_falls_back_to_the_whole_statement(tmp_path):
+  fetch = FakeStatements(drift=123)
+  cache = statements.StatementCache(tmp_path, '111', fetch)
+  start, end = datetime.date(2020, 1, 1), datetime.date(2020, 3, 31)
+  ids, (start_balance, end_balance) = get(cache, start, end)
+  assert fetch.requests == [(start, end)]
+  data = fetch(start, end)
+  # The server's own balances, with nothing carried across months.
+  assert (start_balance, end_balance) == (
+      float(data['start_balance']), float(data['end_balance']))
+  assert ids == expected(start, end)[0]
+  assert list(tmp_path.iterdir()) == []
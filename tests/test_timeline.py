@@ -0,0 +1,46 @@
+import datetime
+
+import pytest
+
+from venmo_client import model
+from venmo_client import timeline
+
+from records import story
+
+START = datetime.datetime(2021, 1, 1)
+
+
+def transaction(i):
+  when = (START + datetime.timedelta(hours=i)).isoformat()
+  return model.Transaction.new(**story(f's{i}', when, 'dinner'))
+
+
+def pages(items, size=3):
+  # Like `transactions()`, one generator per page.
+  for start in range(0, len(items), size):
+    yield (item for item in items[start:start + size])
+
+
+def test_merges_stories_history_and_payments():
+  newest_first = [transaction(i) for i in reversed(range(10))]
+  stories = pages([item for item in newest_first if int(item.id[1:]) % 2 == 0])
+  # `get_transaction_history()` returns the odd ones, oldest first.
+  history = [item for item in reversed(newest_first)
+      if int(item.id[1:]) % 2 == 1]
+  # The same payments again, bare, as `payments()` would yield them.
+  payments = (item.payment for item in newest_first
+      if int(item.id[1:]) % 3 == 0)
+  merged = list(timeline.merge(stories, history, payments))
+  assert [item.id for item in merged] == [f's{i}' for i in reversed(range(10))]
+
+
+def test_oldest_first_merge_sorts_lists():
+  history = [transaction(i) for i in (3, 1, 2)]
+  merged = timeline.merge(history, newest_first=False)
+  assert [item.id for item in merged] == ['s1', 's2', 's3']
+
+
+def test_lazy_stream_out_of_order_raises():
+  oldest_first = (transaction(i) for i in range(3))
+  with pytest.raises(ValueError):
+    list(timeline.merge(oldest_first))
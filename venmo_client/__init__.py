@@ -1,4 +1,25 @@
-from venmo_client import auth
-from venmo_client import model
-from venmo_client import util
-from venmo_client.client import VenmoClient
+import importlib
+
+__all__ = [
+    'aggregate',
+    'archive',
+    'auth',
+    'decode',
+    'filters',
+    'model',
+    'reconcile',
+    'timeline',
+    'util',
+    'VenmoClient',
+]
+
+
+def __getattr__(name):
+  # Imported on first use, so `venmo_client.launcher` can start without
+  # loading `requests` and `rich`.
+  if name == 'VenmoClient':
+    from venmo_client.client import VenmoClient
+    return VenmoClient
+  if name in __all__:
+    return importlib.import_module(f'venmo_client.{name}')
+  raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,266 @@
+import abc
+import collections
+import datetime
+
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+from venmo_client import model
+from venmo_client import reconcile
+from venmo_client import util
+
+__all__ = [
+    'Aggregate',
+    'Aggregator',
+    'Count',
+    'GroupBy',
+    'MonthlyFlows',
+    'Sum',
+    'TopN',
+    'amount_cents',
+    'counterparty',
+    'iter_items',
+    'merchant',
+    'note',
+    'run',
+]
+
+Item = Union[model.Transaction, model.Payment]
+KeyFn = Callable[[Item], Optional[Hashable]]
+
+
+def iter_items(stream: Iterable[Any]) -> Iterable[Item]:
+  # `transactions()` yields one generator per page; flatten those lazily.
+  for item in stream:
+    if isinstance(item, (model.Transaction, model.Payment)):
+      yield item
+    else:
+      yield from item
+
+
+def merchant(item: Item) -> Optional[str]:
+  if isinstance(item, model.Transaction):
+    if item.type == 'authorization':
+      return item.authorization.merchant.display_name
+    if item.type == 'capture':
+      return item.capture.authorization.merchant.display_name
+  return None
+
+
+def counterparty(user_id: str) -> KeyFn:
+  def key(item: Item) -> Optional[str]:
+    payment = item if isinstance(item, model.Payment) else item.payment
+    if payment is None:
+      return None
+    if payment.actor.id != user_id:
+      return payment.actor.username
+    target = payment.target
+    if target.user is not None:
+      return target.user.username
+    return target.merchant.display_name
+  return key
+
+
+def note(item: Item) -> Optional[str]:
+  return item.note or None
+
+
+def amount_cents(item: Item) -> int:
+  return util.to_cents(item.amount)
+
+
+def _date(item: Item) -> datetime.datetime:
+  if isinstance(item, model.Payment):
+    return item.date_created
+  return item.datetime_created
+
+
+class Aggregator(abc.ABC):
+  # `merge` folds `other` into `self` and returns `self`; `other` is left
+  # untouched and shares no state with the result.
+
+  @abc.abstractmethod
+  def empty(self) -> 'Aggregator':
+    pass
+
+  @abc.abstractmethod
+  def add(self, item: Item):
+    pass
+
+  @abc.abstractmethod
+  def merge(self, other: 'Aggregator') -> 'Aggregator':
+    pass
+
+  @abc.abstractmethod
+  def result(self) -> Any:
+    pass
+
+
+class Count(Aggregator):
+
+  def __init__(self):
+    self.count = 0
+
+  def empty(self) -> 'Count':
+    return Count()
+
+  def add(self, item: Item):
+    self.count += 1
+
+  def merge(self, other: 'Count') -> 'Count':
+    self.count += other.count
+    return self
+
+  def result(self) -> int:
+    return self.count
+
+
+class Sum(Aggregator):
+
+  def __init__(self, value: Optional[Callable[[Item], int]] = None):
+    self.value = value or amount_cents
+    self.total = 0
+
+  def empty(self) -> 'Sum':
+    return Sum(self.value)
+
+  def add(self, item: Item):
+    self.total += self.value(item)
+
+  def merge(self, other: 'Sum') -> 'Sum':
+    self.total += other.total
+    return self
+
+  def result(self) -> int:
+    return self.total
+
+
+class GroupBy(Aggregator):
+
+  def __init__(self, key: KeyFn, aggregator: Aggregator):
+    self.key = key
+    self.aggregator = aggregator
+    self.groups: Dict[Hashable, Aggregator] = {}
+
+  def empty(self) -> 'GroupBy':
+    return GroupBy(self.key, self.aggregator)
+
+  def add(self, item: Item):
+    key = self.key(item)
+    if key is None:
+      return
+    group = self.groups.get(key)
+    if group is None:
+      group = self.groups[key] = self.aggregator.empty()
+    group.add(item)
+
+  def merge(self, other: 'GroupBy') -> 'GroupBy':
+    for key, group in other.groups.items():
+      mine = self.groups.get(key)
+      if mine is None:
+        mine = self.groups[key] = self.aggregator.empty()
+      mine.merge(group)
+    return self
+
+  def result(self) -> Dict[Hashable, Any]:
+    return {key: group.result() for key, group in self.groups.items()}
+
+
+class TopN(Aggregator):
+  # Misra-Gries counters: memory is bounded by `capacity` no matter how many
+  # distinct keys the stream has, and any key occurring more than
+  # total / (capacity + 1) times is guaranteed to survive.
+
+  def __init__(self, n: int, key: KeyFn = note, capacity: Optional[int] = None):
+    self.n = n
+    self.key = key
+    self.capacity = capacity or max(n * 10, 100)
+    self.counters: Dict[Hashable, int] = {}
+
+  def empty(self) -> 'TopN':
+    return TopN(self.n, self.key, self.capacity)
+
+  def _increment(self, key: Hashable, count: int):
+    self.counters[key] = self.counters.get(key, 0) + count
+    if len(self.counters) > self.capacity:
+      floor = sorted(self.counters.values())[-self.capacity - 1]
+      self.counters = {k: c - floor for k, c in self.counters.items()
+          if c > floor}
+
+  def add(self, item: Item):
+    key = self.key(item)
+    if key is not None:
+      self._increment(key, 1)
+
+  def merge(self, other: 'TopN') -> 'TopN':
+    for key, count in other.counters.items():
+      self._increment(key, count)
+    return self
+
+  def result(self) -> List[Tuple[Hashable, int]]:
+    return collections.Counter(self.counters).most_common(self.n)
+
+
+class MonthlyFlows(Aggregator):
+
+  def __init__(self, user_id: str):
+    self.user_id = user_id
+    self.flows: Dict[str, List[int]] = {}
+
+  def empty(self) -> 'MonthlyFlows':
+    return MonthlyFlows(self.user_id)
+
+  def _cents(self, item: Item) -> int:
+    if isinstance(item, model.Payment):
+      item = model.Transaction('payment', item.id, item.date_created,
+          item.note, item.amount, payment=item)
+    return reconcile.signed_cents(item, self.user_id)
+
+  def add(self, item: Item):
+    cents = self._cents(item)
+    flow = self.flows.setdefault(_date(item).strftime('%Y-%m'), [0, 0])
+    if cents >= 0:
+      flow[0] += cents
+    else:
+      flow[1] -= cents
+
+  def merge(self, other: 'MonthlyFlows') -> 'MonthlyFlows':
+    for month, (incoming, outgoing) in other.flows.items():
+      flow = self.flows.setdefault(month, [0, 0])
+      flow[0] += incoming
+      flow[1] += outgoing
+    return self
+
+  def result(self) -> Dict[str, Tuple[int, int]]:
+    return {month: tuple(self.flows[month]) for month in sorted(self.flows)}
+
+
+class Aggregate(Aggregator):
+
+  def __init__(self, **aggregators: Aggregator):
+    self.aggregators = aggregators
+
+  def empty(self) -> 'Aggregate':
+    return Aggregate(**{name: aggregator.empty()
+      for name, aggregator in self.aggregators.items()})
+
+  def add(self, item: Item):
+    for aggregator in self.aggregators.values():
+      aggregator.add(item)
+
+  def consume(self, stream: Iterable[Any]) -> 'Aggregate':
+    for item in iter_items(stream):
+      self.add(item)
+    return self
+
+  def merge(self, other: 'Aggregate') -> 'Aggregate':
+    for name, aggregator in self.aggregators.items():
+      aggregator.merge(other.aggregators[name])
+    return self
+
+  def result(self) -> Dict[str, Any]:
+    return {name: aggregator.result()
+        for name, aggregator in self.aggregators.items()}
+
+
+def run(stream: Iterable[Any], **aggregators: Aggregator) -> Dict[str, Any]:
+  return Aggregate(**aggregators).consume(stream).result()
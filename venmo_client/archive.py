@@ -0,0 +1,298 @@
+import datetime
+import hashlib
+import mmap
+import os
+import pathlib
+import struct
+import threading
+
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from venmo_client import codec
+from venmo_client import model
+
+__all__ = [
+    'Archive'
+]
+
+Record = Dict[str, Any]
+
+# key, timestamp (microseconds), payload offset, payload length
+ENTRY = struct.Struct('<QqQI')
+HEADER = struct.Struct('<I')
+COMPACT_MIN = 4096
+
+Entry = Tuple[int, int, int, int]
+
+
+def _key(story_id: str) -> int:
+  digest = hashlib.blake2b(str(story_id).encode('utf-8'), digest_size=8)
+  return int.from_bytes(digest.digest(), 'little')
+
+
+def _timestamp(value: Union[str, datetime.datetime]) -> int:
+  if isinstance(value, str):
+    value = datetime.datetime.fromisoformat(value)
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=datetime.timezone.utc)
+  return int(value.timestamp() * 1_000_000)
+
+
+class _SortedIndex:
+  # A file of fixed-width entries sorted on one field, searched in place
+  # through a read-only memory map.
+
+  def __init__(self, path: pathlib.Path, field: int):
+    self.path = path
+    self.field = field
+    self.mm = None
+    self.count = 0
+    self.reload()
+
+  def reload(self):
+    if self.mm is not None:
+      self.mm.close()
+      self.mm = None
+    self.count = 0
+    if self.path.exists() and self.path.stat().st_size:
+      with self.path.open('rb') as fp:
+        self.mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+      self.count = len(self.mm) // ENTRY.size
+
+  def entry(self, i: int) -> Entry:
+    return ENTRY.unpack_from(self.mm, i * ENTRY.size)
+
+  def _value(self, i: int) -> int:
+    return ENTRY.unpack_from(self.mm, i * ENTRY.size)[self.field]
+
+  def bisect_left(self, value: int) -> int:
+    lo, hi = 0, self.count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self._value(mid) < value:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  def find(self, value: int) -> Iterator[Entry]:
+    i = self.bisect_left(value)
+    while i < self.count:
+      entry = self.entry(i)
+      if entry[self.field] != value:
+        return
+      yield entry
+      i += 1
+
+  def __iter__(self) -> Iterator[Entry]:
+    if self.mm is None:
+      return iter(())
+    return ENTRY.iter_unpack(self.mm)
+
+  def close(self):
+    if self.mm is not None:
+      self.mm.close()
+      self.mm = None
+
+
+class Archive:
+  # An append-only log of raw story records. `stories.idx` and `stories.dates`
+  # are sorted, memory-mapped indexes by id hash and by creation time; entries
+  # appended since the last compaction live in `stories.tail` and are merged
+  # in once the tail grows past a fraction of the archive. All access goes
+  # through one lock, so an archive can be shared between threads.
+
+  def __init__(self, path: Union[str, pathlib.Path]):
+    self.path = pathlib.Path(path)
+    self.path.mkdir(parents=True, exist_ok=True)
+    self.log_file = self.path / 'stories.log'
+    self.tail_file = self.path / 'stories.tail'
+    self.complete_file = self.path / 'stories.complete'
+    self.crawl_file = self.path / 'stories.crawl'
+    self.ids = _SortedIndex(self.path / 'stories.idx', 0)
+    self.dates = _SortedIndex(self.path / 'stories.dates', 1)
+    self.log_file.touch()
+    self._log = self.log_file.open('ab')
+    self._log_mm = None
+    self._lock = threading.RLock()
+    self._tail: Dict[int, Entry] = {}
+    self._load_tail()
+
+  def _load_tail(self):
+    if not self.tail_file.exists():
+      self.tail_file.touch()
+    log_size = self.log_file.stat().st_size
+    with self.tail_file.open('rb') as fp:
+      data = fp.read()
+    valid = len(data) - len(data) % ENTRY.size
+    for entry in ENTRY.iter_unpack(data[:valid]):
+      # Entries whose payload never made it to the log are dropped.
+      if entry[2] + entry[3] <= log_size:
+        self._tail[entry[0]] = entry
+    self._tail_fp = self.tail_file.open('ab')
+    if valid != len(data):
+      self._tail_fp.truncate(valid)
+
+  def __len__(self) -> int:
+    with self._lock:
+      return self.ids.count + len(self._tail)
+
+  def __contains__(self, story_id: str) -> bool:
+    return self._find(story_id) is not None
+
+  def _view(self, offset: int, length: int) -> memoryview:
+    if self._log_mm is None or offset + length > len(self._log_mm):
+      if self._log_mm is not None:
+        self._log_mm.close()
+      self._log.flush()
+      with self.log_file.open('rb') as fp:
+        self._log_mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(self._log_mm)[offset:offset + length]
+
+  def _decode(self, entry: Entry) -> Record:
+    backend = codec.get()
+    with self._lock, self._view(entry[2], entry[3]) as view:
+      # The stdlib decoder needs `bytes`; the others read the map directly.
+      return backend.loads(view if backend.buffers else view.tobytes())
+
+  def _find(self, story_id: str) -> Optional[Tuple[Entry, Record]]:
+    with self._lock:
+      key = _key(story_id)
+      candidates = list(self.ids.find(key))
+      if key in self._tail:
+        candidates.append(self._tail[key])
+      for entry in candidates:
+        record = self._decode(entry)
+        if record['id'] == story_id:
+          return entry, record
+      return None
+
+  def add(self, record: Record) -> bool:
+    with self._lock:
+      if record['id'] in self:
+        return False
+      payload = codec.dumps(record)
+      offset = self._log.tell() + HEADER.size
+      self._log.write(HEADER.pack(len(payload)) + payload)
+      self._log.flush()
+      entry = (_key(record['id']), _timestamp(record['datetime_created']),
+          offset, len(payload))
+      self._tail_fp.write(ENTRY.pack(*entry))
+      self._tail_fp.flush()
+      self._tail[entry[0]] = entry
+      if len(self._tail) > max(COMPACT_MIN, self.ids.count // 8):
+        self.compact()
+      return True
+
+  def extend(self, records: Iterable[Record]) -> int:
+    return sum(self.add(record) for record in records)
+
+  @property
+  def complete(self) -> bool:
+    # Whether the archive reaches back to the first story on the account.
+    return self.complete_file.exists()
+
+  def mark_complete(self):
+    self.complete_file.touch()
+
+  @property
+  def crawl(self) -> Optional[Dict[str, Any]]:
+    # The cursor of a crawl of newer stories that hasn't yet reached the
+    # stories archived before it began, if one was interrupted.
+    try:
+      with self.crawl_file.open('rb') as fp:
+        return codec.loads(fp.read())
+    except FileNotFoundError:
+      return None
+
+  def save_crawl(self, crawl: Optional[Dict[str, Any]]):
+    if crawl is None:
+      self.crawl_file.unlink(missing_ok=True)
+      return
+    tmp = self.crawl_file.with_name(self.crawl_file.name + '.tmp')
+    with tmp.open('wb') as fp:
+      fp.write(codec.dumps(crawl))
+    os.replace(tmp, self.crawl_file)
+
+  def _edge(self, newest: bool) -> Optional[Record]:
+    with self._lock:
+      entries = list(self._tail.values())
+      if self.dates.count:
+        entries.append(self.dates.entry(self.dates.count - 1 if newest else 0))
+      if not entries:
+        return None
+      pick = max if newest else min
+      return self._decode(pick(entries, key=lambda entry: entry[1]))
+
+  def oldest(self) -> Optional[Record]:
+    return self._edge(newest=False)
+
+  def newest(self) -> Optional[Record]:
+    return self._edge(newest=True)
+
+  def get_raw(self, story_id: str) -> Optional[Record]:
+    found = self._find(story_id)
+    return found and found[1]
+
+  def get(self, story_id: str) -> Optional[model.Transaction]:
+    record = self.get_raw(story_id)
+    return record and model.Transaction.new(**record)
+
+  def between(self,
+      start: Union[str, datetime.datetime],
+      end: Union[str, datetime.datetime]) -> Iterator[model.Transaction]:
+    start, end = _timestamp(start), _timestamp(end)
+    entries = []
+    with self._lock:
+      i = self.dates.bisect_left(start)
+      while i < self.dates.count:
+        entry = self.dates.entry(i)
+        if entry[1] >= end:
+          break
+        entries.append(entry)
+        i += 1
+      entries.extend(entry for entry in self._tail.values()
+          if start <= entry[1] < end)
+    entries.sort(key=lambda entry: entry[1])
+    for entry in entries:
+      yield model.Transaction.new(**self._decode(entry))
+
+  def _write_index(self, index: _SortedIndex, entries: Iterable[Entry]):
+    tmp = index.path.with_name(index.path.name + '.tmp')
+    with tmp.open('wb') as fp:
+      fp.write(b''.join(ENTRY.pack(*entry) for entry in entries))
+      fp.flush()
+      os.fsync(fp.fileno())
+    index.close()
+    os.replace(tmp, index.path)
+    index.reload()
+
+  def compact(self):
+    with self._lock:
+      if not self._tail:
+        return
+      self._log.flush()
+      os.fsync(self._log.fileno())
+      # Keyed by offset so that entries already merged by an interrupted
+      # compaction aren't indexed twice.
+      entries = {entry[2]: entry for entry in self.ids}
+      entries.update((entry[2], entry) for entry in self._tail.values())
+      entries = list(entries.values())
+      entries.sort(key=lambda entry: entry[0])
+      self._write_index(self.ids, entries)
+      entries.sort(key=lambda entry: entry[1])
+      self._write_index(self.dates, entries)
+      self._tail.clear()
+      self._tail_fp.truncate(0)
+      self._tail_fp.seek(0)
+
+  def close(self):
+    with self._lock:
+      self.compact()
+      self._tail_fp.close()
+      self._log.close()
+      if self._log_mm is not None:
+        self._log_mm.close()
+        self._log_mm = None
+      self.ids.close()
+      self.dates.close()
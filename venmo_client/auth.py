@@ -1,5 +1,7 @@
+import os
 import pathlib
 import json
+import threading
 
 from typing import Union
 
@@ -10,6 +12,9 @@ __all__ = [
 
 
 class Config:
+  # Safe to share between threads: reads and updates of the credentials happen
+  # under one lock, and `auth.json` is replaced atomically so a concurrent
+  # reader (or a crash) never sees a half-written file.
   
   def __init__(self,
       config_dir: Union[str, pathlib.Path]):
@@ -19,34 +24,48 @@ class Config:
     if self.config_dir and not self.config_dir.exists():
       self.config_dir.mkdir(parents=True, exist_ok=True)
     self.auth_file = self.config_dir / 'auth.json'
-    self.access_token, self.user_id = None, None
-    if self.auth_file.exists():
-      with self.auth_file.open('r') as fp:
-        auth_json = json.load(fp)
-      self.user_id = auth_json['user_id']
-      self.access_token = auth_json['access_token']
+    self.lock = threading.RLock()
+    self.reload()
+
+  def reload(self):
+    with self.lock:
+      self.access_token, self.user_id = None, None
+      if self.auth_file.exists():
+        with self.auth_file.open('r') as fp:
+          auth_json = json.load(fp)
+        self.user_id = auth_json['user_id']
+        self.access_token = auth_json['access_token']
 
   def is_authenticated(self) -> bool:
-    return self.access_token is not None and self.user_id is not None
+    with self.lock:
+      return self.access_token is not None and self.user_id is not None
 
   def delete(self):
-    self.auth_file.unlink()
-    self.user_id = None
-    self.access_token = None
+    with self.lock:
+      if self.auth_file.exists():
+        self.auth_file.unlink()
+      self.user_id = None
+      self.access_token = None
 
   def save(self, user_id: str, access_token: str):
-    self.user_id = user_id
-    self.access_token = access_token
-    with self.auth_file.open('w') as fp:
-      json.dump(dict(user_id=user_id, access_token=access_token), fp)
+    with self.lock:
+      tmp_file = self.auth_file.with_name(f'.{self.auth_file.name}.tmp')
+      with tmp_file.open('w') as fp:
+        json.dump(dict(user_id=user_id, access_token=access_token), fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+      os.replace(tmp_file, self.auth_file)
+      self.user_id = user_id
+      self.access_token = access_token
 
   def get_access_token(self) -> str:
-    if not self.access_token:
-      raise ValueError('Haven\'t authenticated yet.')
-    return self.access_token
+    with self.lock:
+      if not self.access_token:
+        raise ValueError('Haven\'t authenticated yet.')
+      return self.access_token
 
   def get_user_id(self) -> str:
-    if not self.user_id:
-      raise ValueError('Haven\'t authenticated yet.')
-    return self.user_id
-
+    with self.lock:
+      if not self.user_id:
+        raise ValueError('Haven\'t authenticated yet.')
+      return self.user_id
@@ -0,0 +1,282 @@
+import collections
+import datetime
+import hashlib
+import hmac
+import json
+import os
+import pathlib
+import re
+import secrets
+import threading
+import time
+import urllib.parse as urlparse
+
+from typing import Any, Deque, Dict, Optional, Tuple, Union
+
+import requests
+from requests import structures
+
+from venmo_client import codec
+
+__all__ = [
+    'Recorder',
+    'Replayer',
+    'Scrubber',
+    'load_salt',
+]
+
+SCRUBBED = '<scrubbed>'
+SECRET_KEYS = frozenset([
+    'access_token',
+    'refresh_token',
+    'password',
+    'phone_email_or_username',
+    'funding_source_id',
+])
+PII_KEYS = frozenset([
+    'phone',
+    'email',
+    'first_name',
+    'last_name',
+    'display_name',
+    'about',
+    'profile_picture_url',
+    'username',
+])
+# Free text, pseudonymized unless a recording opts to keep it.
+NOTE_KEYS = frozenset([
+    'note',
+])
+# Keys whose values are user ids, in bodies and query strings. The `id` of any
+# object with a `username` is a user id too.
+USER_ID_KEYS = frozenset([
+    'actor',
+    'profileId',
+    'profile_id',
+    'user_id',
+])
+URL_KEYS = frozenset([
+    'next',
+    'previous',
+])
+# Path segments that name a user, and the pseudonym key for each.
+USER_PATHS = [
+    (re.compile(r'(/users/)([^/]+)'), 'username'),
+    (re.compile(r'(/stories/target-or-actor/)([^/]+)'), 'user_id'),
+]
+SECRET_HEADERS = frozenset([
+    'authorization',
+    'cookie',
+    'set-cookie',
+    'device-id',
+    'venmo-otp',
+    'venmo-otp-secret',
+])
+SALT_FILE = 'cassette.salt'
+PSEUDONYM_DIGITS = 16
+PSEUDONYM = re.compile(f'[a-z_]+-[0-9a-f]{{{PSEUDONYM_DIGITS}}}')
+KEPT_RESPONSE_HEADERS = frozenset([
+    'content-type',
+    'venmo-otp-secret',
+])
+
+
+def load_salt(config_dir: Union[str, pathlib.Path]) -> bytes:
+  # The secret pseudonyms are keyed with, created on first use. It stays in
+  # the config directory and never goes into a cassette, so a shared cassette
+  # can't be unscrubbed by hashing a list of candidate usernames.
+  config_dir = pathlib.Path(config_dir)
+  config_dir.mkdir(parents=True, exist_ok=True)
+  path = config_dir / SALT_FILE
+  if not path.exists():
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    with tmp.open('w') as fp:
+      os.chmod(tmp, 0o600)
+      fp.write(secrets.token_hex(32))
+    try:
+      # Fails if another process got there first; theirs is kept.
+      os.link(tmp, path)
+    except FileExistsError:
+      pass
+    finally:
+      tmp.unlink()
+  return bytes.fromhex(path.read_text().strip())
+
+
+class Scrubber:
+  # Strips secrets from recorded exchanges and replaces personal details with
+  # pseudonyms keyed by `salt`. Notes are free text that often names people,
+  # so they are pseudonymized too unless `keep_notes` is set.
+
+  def __init__(self, salt: bytes, keep_notes: bool = False):
+    self.salt = salt
+    self.pii_keys = PII_KEYS if keep_notes else PII_KEYS | NOTE_KEYS
+
+  def pseudonym(self, key: str, value: Any) -> Any:
+    # Stable per value, so the same person keeps the same name across
+    # records. Pseudonyms map to themselves, so a replaying client that only
+    # knows the recorded user id still builds the recorded URLs.
+    if not isinstance(value, str) or not value:
+      return value
+    if PSEUDONYM.fullmatch(value) and value.startswith(f'{key}-'):
+      return value
+    digest = hmac.new(self.salt, f'{key}:{value}'.encode('utf-8'),
+        hashlib.sha256).hexdigest()[:PSEUDONYM_DIGITS]
+    return f'{key}-{digest}'
+
+  def scrub(self, data: Any) -> Any:
+    if isinstance(data, dict):
+      scrubbed = {}
+      for key, value in data.items():
+        if key in SECRET_KEYS and value is not None:
+          scrubbed[key] = SCRUBBED
+        elif key in self.pii_keys:
+          scrubbed[key] = self.pseudonym(key, value)
+        elif key in USER_ID_KEYS and isinstance(value, str):
+          scrubbed[key] = self.pseudonym('user_id', value)
+        elif key == 'id' and 'username' in data:
+          scrubbed[key] = self.pseudonym('user_id', value)
+        elif key in URL_KEYS and isinstance(value, str):
+          scrubbed[key] = self.scrub_url(value)
+        else:
+          scrubbed[key] = self.scrub(value)
+      return scrubbed
+    if isinstance(data, list):
+      return [self.scrub(value) for value in data]
+    return data
+
+  def scrub_body(self, body: Optional[bytes]) -> Optional[str]:
+    if not body:
+      return None
+    try:
+      return json.dumps(self.scrub(codec.loads(body)), sort_keys=True)
+    except ValueError:
+      return SCRUBBED
+
+  def _scrub_query_value(self, key: str, value: str) -> str:
+    if key in SECRET_KEYS:
+      return SCRUBBED
+    if key in USER_ID_KEYS:
+      return self.pseudonym('user_id', value)
+    return value
+
+  def scrub_url(self, url: str, drop: frozenset = frozenset()) -> str:
+    parsed = urlparse.urlparse(url)
+    path = parsed.path
+    for pattern, key in USER_PATHS:
+      path = pattern.sub(lambda match:
+          match.group(1) + self.pseudonym(key, match.group(2)), path)
+    query = [(key, self._scrub_query_value(key, value))
+        for key, value in sorted(urlparse.parse_qsl(parsed.query))
+        if key not in drop]
+    return parsed._replace(path=path,
+        query=urlparse.urlencode(query)).geturl()
+
+  def request_key(self, request: requests.PreparedRequest) -> Tuple[str, str]:
+    # Page sizes are picked adaptively from observed latency, so `limit` is
+    # left out of the key; pages are still served in the order they were
+    # recorded, and `paginate` trims a page that is longer than it asked for.
+    return request.method, self.scrub_url(request.url, frozenset(['limit']))
+
+
+def _scrub_headers(headers, keep=None) -> Dict[str, str]:
+  return {
+      key: SCRUBBED if key.lower() in SECRET_HEADERS else value
+      for key, value in headers.items()
+      if keep is None or key.lower() in keep
+  }
+
+
+class Recorder:
+  # A transport that forwards to a real session and appends every exchange,
+  # with secrets and personal details scrubbed, to a JSON-lines cassette.
+
+  def __init__(self,
+      path: Union[str, pathlib.Path],
+      salt: bytes,
+      transport: Optional[Any] = None,
+      user_id: Optional[str] = None,
+      keep_notes: bool = False):
+    self.path = pathlib.Path(path)
+    self.scrubber = Scrubber(salt, keep_notes=keep_notes)
+    self.transport = transport or requests.Session()
+    self._lock = threading.Lock()
+    self._fp = self.path.open('w')
+    self._write(dict(version=1,
+        user_id=self.scrubber.pseudonym('user_id', user_id)))
+
+  def _write(self, entry: Dict[str, Any]):
+    with self._lock:
+      self._fp.write(codec.dumps(entry).decode('utf-8') + '\n')
+      self._fp.flush()
+
+  def send(self, request: requests.PreparedRequest,
+      **kwargs) -> requests.Response:
+    start = time.perf_counter()
+    response = self.transport.send(request, **kwargs)
+    elapsed = time.perf_counter() - start
+    method, url = self.scrubber.request_key(request)
+    self._write(dict(
+        method=method,
+        url=url,
+        request_headers=_scrub_headers(request.headers),
+        request_body=self.scrubber.scrub_body(request.body),
+        status=response.status_code,
+        headers=_scrub_headers(response.headers, KEPT_RESPONSE_HEADERS),
+        body=self.scrubber.scrub_body(response.content),
+        elapsed=elapsed))
+    return response
+
+  def close(self):
+    self._fp.close()
+
+
+class Replayer:
+  # Serves recorded responses in the order they were captured, matched on
+  # method and URL. `latency` scales the recorded round-trip times: 0 replays
+  # at memory speed, 1 reproduces the original timing. Requests are keyed with
+  # `salt`, which has to be the one the cassette was recorded with for real
+  # usernames to match; the recorded user id matches with any salt.
+
+  def __init__(self, path: Union[str, pathlib.Path], salt: bytes,
+      latency: float = 0.):
+    self.path = pathlib.Path(path)
+    self.scrubber = Scrubber(salt)
+    self.latency = latency
+    self.user_id = None
+    self._lock = threading.Lock()
+    self._responses: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = (
+        collections.defaultdict(collections.deque))
+    with self.path.open('r') as fp:
+      for line in fp:
+        entry = codec.loads(line)
+        if 'version' in entry:
+          self.user_id = entry.get('user_id')
+          continue
+        self._responses[entry['method'], entry['url']].append(entry)
+
+  def _next(self, key: Tuple[str, str]) -> Dict[str, Any]:
+    with self._lock:
+      queue = self._responses.get(key)
+      if not queue:
+        raise ValueError(f'No recorded response for {key[0]} {key[1]}')
+      # The last response for a request is reused once the queue runs dry.
+      return queue.popleft() if len(queue) > 1 else queue[0]
+
+  def send(self, request: requests.PreparedRequest,
+      **kwargs) -> requests.Response:
+    entry = self._next(self.scrubber.request_key(request))
+    if self.latency:
+      time.sleep(entry['elapsed'] * self.latency)
+    response = requests.Response()
+    response.status_code = entry['status']
+    response.headers = structures.CaseInsensitiveDict(entry['headers'])
+    response._content = (entry['body'] or '').encode('utf-8')
+    response.encoding = 'utf-8'
+    response.url = request.url
+    response.request = request
+    response.elapsed = datetime.timedelta(seconds=entry['elapsed'])
+    return response
+
+  def close(self):
+    pass
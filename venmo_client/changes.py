@@ -0,0 +1,116 @@
+import dataclasses
+import json
+import os
+import pathlib
+
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+from venmo_client import model
+
+__all__ = [
+    'Change',
+    'ChangeFeed',
+    'Fingerprint',
+    'OPEN_STATUSES',
+]
+
+OPEN_STATUSES = ('pending', 'held')
+
+
+class Fingerprint(NamedTuple):
+  status: str
+  date_completed: Optional[str]
+  date_reminded: Optional[str]
+
+  @classmethod
+  def of(cls, payment: model.Payment) -> 'Fingerprint':
+    return cls(payment.status,
+        payment.date_completed and payment.date_completed.isoformat(),
+        payment.date_reminded and payment.date_reminded.isoformat())
+
+
+@dataclasses.dataclass(frozen=True)
+class Change:
+  payment: model.Payment
+  # None the first time a payment is seen.
+  old: Optional[Fingerprint]
+  new: Fingerprint
+
+  @property
+  def fields(self) -> List[str]:
+    if self.old is None:
+      return list(Fingerprint._fields)
+    return [field for field, old, new in zip(Fingerprint._fields, self.old,
+        self.new) if old != new]
+
+  def serialize(self):
+    return dict(payment=self.payment.serialize(),
+        old=self.old and self.old._asdict(), new=self.new._asdict())
+
+
+class ChangeFeed:
+  # Fingerprints of every open payment, persisted as JSON in the config
+  # directory. Settled and cancelled payments are final, so only open ones are
+  # tracked: each poll reads the open listing and looks up just the payments
+  # that dropped out of it, which keeps the cost proportional to the number of
+  # open payments and changes rather than the whole history. Fingerprints
+  # recorded for another account are discarded. Without a `path` nothing is
+  # persisted, and the owner saves `state()` alongside its own data.
+
+  def __init__(self, path: Optional[Union[str, pathlib.Path]], user_id: str,
+      action: str = 'charge'):
+    self.path = pathlib.Path(path) if path is not None else None
+    self.user_id = user_id
+    self.action = action
+    self.fingerprints: Dict[str, Fingerprint] = {}
+    if self.path is not None and self.path.exists():
+      with self.path.open('r') as fp:
+        self.restore(json.load(fp))
+
+  def restore(self, data: Dict[str, Any]):
+    if data.get('user_id') != self.user_id:
+      return
+    self.fingerprints = {payment_id: Fingerprint(*fingerprint)
+        for payment_id, fingerprint in data['fingerprints'].items()}
+
+  def state(self) -> Dict[str, Any]:
+    return dict(user_id=self.user_id, fingerprints=self.fingerprints)
+
+  def save(self):
+    tmp = self.path.with_name(self.path.name + '.tmp')
+    with tmp.open('w') as fp:
+      json.dump(self.state(), fp)
+    os.replace(tmp, self.path)
+
+  def _observe(self, payment: model.Payment) -> Optional[Change]:
+    old = self.fingerprints.get(payment.id)
+    new = Fingerprint.of(payment)
+    if new.status in OPEN_STATUSES:
+      self.fingerprints[payment.id] = new
+    else:
+      self.fingerprints.pop(payment.id, None)
+    if old == new:
+      return None
+    return Change(payment, old, new)
+
+  def poll(self, client) -> List[Change]:
+    changes = []
+    seen = set()
+    for payment in client.payments(action=self.action, status=OPEN_STATUSES):
+      seen.add(payment.id)
+      change = self._observe(payment)
+      if change is not None:
+        changes.append(change)
+    # Anything that left the open listing has been settled or cancelled.
+    for payment_id in set(self.fingerprints) - seen:
+      try:
+        payment = client.get_payment(payment_id)
+      except ValueError:
+        # Try again on the next poll.
+        continue
+      change = self._observe(payment)
+      if change is not None:
+        changes.append(change)
+    if self.path is not None:
+      self.save()
+    return changes
@@ -1,14 +1,20 @@
+import csv
 import locale
 import sys
 
-from typing import Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
 
 import click
 from rich import prompt
-from rich import table
 
+from venmo_client import cassette
 from venmo_client import client as vc
+from venmo_client import codec
 from venmo_client import console
+from venmo_client import daemon as daemon_lib
+from venmo_client import export as export_lib
+from venmo_client import ledger as ledger_lib
+from venmo_client import profiling
 
 locale.setlocale(locale.LC_ALL, '')
 
@@ -19,9 +25,52 @@ def check_if_proper_amount(amount: float):
   #if amount % 0.01 != 0.:
   #  console.error(f'Must enter maximum of two decimal places: {amount}')
 
+OUTPUT_FORMATS = ('table', 'jsonl', 'csv')
+
+def stream_output(output_format: str, columns: List[Dict[str, Any]],
+    items: Iterable[Any], to_row: Callable[[Any, bool], Sequence[str]],
+    status: str):
+  if output_format == 'jsonl':
+    for item in items:
+      sys.stdout.write(codec.dumps(item.serialize()).decode('utf-8') + '\n')
+  elif output_format == 'csv':
+    writer = csv.writer(sys.stdout)
+    writer.writerow([column['header'] for column in columns])
+    for item in items:
+      writer.writerow(to_row(item, True))
+  else:
+    with console.status(status):
+      console.stream_table(columns, (to_row(item, False) for item in items))
+  sys.stdout.flush()
+
+def report_operations(operations: Iterable[Any]):
+  for op in operations:
+    if op.kind == 'charge':
+      what = f'Charged {op.payload["username"]}'
+    else:
+      what = f'Settled payment {op.payload["payment_id"]}'
+    if op.state == 'done':
+      console.print(f'[bold green]{what} successfully!')
+    else:
+      console.print(f'[bold red]{what} failed ({op.state}): {op.error}')
+
 def make_client(ctx: click.Context, check_authentication: bool = True) -> vc.VenmoClient:
   config_dir = ctx.obj['config_dir']
-  client = vc.VenmoClient(config_dir)
+  # Commands forwarded to `venmo daemon` share its long-lived client.
+  client = ctx.obj.get('client') or vc.VenmoClient(config_dir)
+  if ctx.obj.get('replay'):
+    client.transport = cassette.Replayer(ctx.obj['replay'],
+        cassette.load_salt(config_dir), latency=ctx.obj['replay_latency'])
+    if not client.is_authenticated():
+      # Replays never send the token, so any placeholder will do.
+      client.auth_config.user_id = client.transport.user_id
+      client.auth_config.access_token = cassette.SCRUBBED
+  elif ctx.obj.get('record'):
+    client.transport = cassette.Recorder(ctx.obj['record'],
+        cassette.load_salt(config_dir), transport=client.sessions,
+        user_id=client.auth_config.user_id,
+        keep_notes=ctx.obj['record_notes'])
+    ctx.call_on_close(client.transport.close)
   if check_authentication:
     if not client.is_authenticated():
       console.error(
@@ -37,10 +86,53 @@ def make_client(ctx: click.Context, check_authentication: bool = True) -> vc.Ven
     type=str,
     default='.venmo-config',
     help='Directory for Venmo authentication information')
+@click.option(
+    '--record',
+    type=click.Path(),
+    default=None,
+    help='Record scrubbed requests and responses to this cassette file')
+@click.option(
+    '--record-notes',
+    is_flag=True,
+    default=False,
+    help='Keep payment notes in recorded cassettes instead of pseudonyms')
+@click.option(
+    '--replay',
+    type=click.Path(exists=True),
+    default=None,
+    help='Serve responses from this cassette file instead of the network')
+@click.option(
+    '--replay-latency',
+    type=float,
+    default=0.,
+    help='Fraction of the recorded latency to reproduce when replaying')
+@click.option(
+    '--profile',
+    type=click.Path(),
+    default=None,
+    help='Profile the command and write a report (.txt), collapsed stacks '
+    '(.folded) and pstats (.pstats) under this path prefix')
 @click.pass_context
-def cli(ctx: click.Context, config_dir: str = '.venmo-config'):
+def cli(ctx: click.Context, config_dir: str = '.venmo-config',
+    record: Optional[str] = None, record_notes: bool = False,
+    replay: Optional[str] = None, replay_latency: float = 0.,
+    profile: Optional[str] = None):
   ctx.ensure_object(dict)
   ctx.obj['config_dir'] = config_dir
+  ctx.obj['record'] = record
+  ctx.obj['record_notes'] = record_notes
+  ctx.obj['replay'] = replay
+  ctx.obj['replay_latency'] = replay_latency
+  if profile:
+    profiler = profiling.Profiler(profile)
+    def finish():
+      profiler.stop()
+      summary = profiler.save().split('\n\n')[:2]
+      console.print('\n\n'.join(summary), markup=False, highlight=False)
+      console.print(f'[dim]Profile written to {profile}.txt, '
+          f'{profile}.folded and {profile}.pstats')
+    ctx.call_on_close(finish)
+    profiler.start()
   
 
 @cli.command()
@@ -87,9 +179,13 @@ def logout(ctx: click.Context):
     type=str,
     default=None,
     help='Memo for Venmo charge')
+@click.option('--workers',
+    default=4,
+    help='Number of charges sent concurrently',
+    type=int)
 @click.pass_context
 def charge(ctx: click.Context, username: Optional[str], amount: Optional[float],
-    memo: Optional[str]):
+    memo: Optional[str], workers: int):
   client = make_client(ctx)
   if not username:
     username = prompt.Prompt.ask('Enter username to charge')
@@ -103,10 +199,18 @@ def charge(ctx: click.Context, username: Optional[str], amount: Optional[float],
     if not memo:
       console.error('Please enter memo.')
   usernames = username.split(',')
-  for username in usernames:
-    with console.status(f'Charging [bold]{username}'):
-      client.request(memo, username, amount)
-    console.print(f'[bold green]Charged {username} successfully!')
+  outbox = client.outbox()
+  unfinished = [op for username in usernames
+      for op in outbox.unfinished_charges(username, amount, memo)]
+  if unfinished:
+    for op in unfinished:
+      console.print(f'[bold red]Charging {op.payload["username"]} with this '
+          f'amount and memo is still {op.state}.')
+    console.error('Run `venmo drain` to finish it before charging again.')
+  keys = [outbox.charge(username, amount, memo) for username in usernames]
+  with console.status(f'Charging [bold]{", ".join(usernames)}'):
+    outbox.drain(workers=workers)
+  report_operations(outbox.get(key) for key in keys)
 
 @cli.command()
 @click.pass_context
@@ -126,16 +230,21 @@ def charge(ctx: click.Context, username: Optional[str], amount: Optional[float],
     default=50,
     help='Maximum number of payments',
     type=int)
+@click.option('--format', 'output_format',
+    type=click.Choice(OUTPUT_FORMATS),
+    default='table',
+    help='Output format')
 def payments(ctx: click.Context, action: str, cancelled: bool,
-    pending: bool, settled: bool, limit: int):
+    pending: bool, settled: bool, limit: int, output_format: str):
   client = make_client(ctx, check_authentication=True)
-  tab = table.Table(show_header=True, header_style="bold")
-  tab.add_column("Date", style='dim')
-  tab.add_column("Name")
-  tab.add_column("Amount", style='green', justify='right')
-  tab.add_column("Memo")
-  tab.add_column("Reminded?")
-  tab.add_column("Status", style='dim')
+  columns = [
+      dict(header='Date', style='dim', width=8, min_width=8),
+      dict(header='Name', width=14),
+      dict(header='Amount', style='green', justify='right', width=10),
+      dict(header='Memo', width=16),
+      dict(header='Reminded?', width=9),
+      dict(header='Status', style='dim', width=9),
+  ]
 
   status = ()
   if pending:
@@ -144,18 +253,20 @@ def payments(ctx: click.Context, action: str, cancelled: bool,
     status += ('cancelled',)
   if settled:
     status += ('settled',)
-  with console.status('Loading payments'):
-    for txn in client.payments(status=status, limit=limit, action=action):
-      has_reminded = bool(txn.date_reminded)
-      date_requested = txn.date_created
-      status = txn.status
-      tab.add_row(
-          date_requested.strftime('%m/%d/%y'), txn.target.user.display_name,
-          f'{locale.currency(txn.amount)}', txn.note,
-          '[green]Yes[/green]'
-          if has_reminded else '[red]No[/red]',
-          txn.status)
-  console.print(tab)
+
+  def to_row(txn, plain):
+    has_reminded = bool(txn.date_reminded)
+    if plain:
+      reminded = 'yes' if has_reminded else 'no'
+    else:
+      reminded = '[green]Yes[/green]' if has_reminded else '[red]No[/red]'
+    return (txn.date_created.strftime('%m/%d/%y'),
+        txn.target.user.display_name, f'{locale.currency(txn.amount)}',
+        txn.note, reminded, txn.status)
+
+  txns = client.payments(status=status, limit=limit, action=action)
+  stream_output(output_format, columns, txns, to_row,
+      status='Loading payments')
 
 @cli.command()
 @click.pass_context
@@ -163,20 +274,24 @@ def payments(ctx: click.Context, action: str, cancelled: bool,
     default=50,
     help='Maximum number of payments',
     type=int)
-def notifications(ctx: click.Context, limit: int):
+@click.option('--format', 'output_format',
+    type=click.Choice(OUTPUT_FORMATS),
+    default='table',
+    help='Output format')
+def notifications(ctx: click.Context, limit: int, output_format: str):
   client = make_client(ctx, check_authentication=True)
-  tab = table.Table(show_header=True, header_style="bold")
-  tab.add_column("Date", style='dim')
-  tab.add_column("Type")
-  tab.add_column("Message")
+  columns = [
+      dict(header='Date', style='dim', width=8, min_width=8),
+      dict(header='Type', width=18),
+      dict(header='Message', min_width=40),
+  ]
 
-  with console.status('Loading notifications'):
-    for txn in client.notifications(limit=limit):
-      tab.add_row(
-          txn.date_created.strftime('%m/%d/%y'),
-          txn.type,
-          txn.message)
-  console.print(tab)
+  def to_row(txn, plain):
+    return (txn.date_created.strftime('%m/%d/%y'), txn.type, txn.message)
+
+  txns = client.notifications(limit=limit)
+  stream_output(output_format, columns, txns, to_row,
+      status='Loading notifications')
 
 @cli.command()
 @click.pass_context
@@ -196,4 +311,186 @@ def settle(ctx: click.Context, limit: int):
   pick = prompt.IntPrompt.ask('Which notification?', choices=list(map(str,
     valid_choices)))
   notif = notifs[pick - 1]
-  client.settle(notif.payment.id)
+  outbox = client.outbox()
+  # Keyed on the payment so a payment is never settled twice.
+  key = outbox.settle(notif.payment.id, key=f'settle:{notif.payment.id}')
+  with console.status('Settling'):
+    outbox.drain(workers=1)
+  report_operations([outbox.get(key)])
+
+
+@cli.command()
+@click.pass_context
+@click.option('--workers',
+    default=4,
+    help='Number of operations sent concurrently',
+    type=int)
+def drain(ctx: click.Context, workers: int):
+  client = make_client(ctx, check_authentication=True)
+  outbox = client.outbox()
+  pending = outbox.operations('queued') + outbox.operations('unknown')
+  if not pending:
+    console.print('[bold green]Nothing left to send.')
+    return
+  with console.status(f'Sending {len(pending)} queued operations'):
+    outbox.drain(workers=workers)
+  report_operations(outbox.get(op.key) for op in pending)
+
+
+@cli.command()
+@click.pass_context
+@click.argument('kind', type=click.Choice(export_lib.EXPORT_KINDS))
+@click.argument('path', type=click.Path())
+@click.option('--format', 'output_format',
+    type=click.Choice(export_lib.EXPORT_FORMATS),
+    default='jsonl',
+    help='Output format')
+@click.option('--page-size',
+    default=50,
+    help='Number of records requested per page',
+    type=int)
+@click.option('--restart/--no-restart',
+    default=False,
+    help='Ignore any checkpoint and export from the beginning')
+def export(ctx: click.Context, kind: str, path: str, output_format: str,
+    page_size: int, restart: bool):
+  client = make_client(ctx, check_authentication=True)
+  exporter = export_lib.Exporter(client, kind, path,
+      output_format=output_format, page_size=page_size)
+  checkpoint = None if restart else exporter.load_checkpoint()
+  if checkpoint and checkpoint['done']:
+    console.print(f'[bold green]Export of {checkpoint["records"]} {kind} to '
+        f'{path} is already complete. Pass --restart to export again.')
+    return
+  if checkpoint:
+    console.print(f'Resuming after {checkpoint["records"]} {kind} '
+        f'({checkpoint["pages"]} pages)')
+  with console.status(f'Exporting {kind}') as status:
+    def on_page(checkpoint):
+      status.update(f'Exported {checkpoint["records"]} {kind}')
+    checkpoint = exporter.run(restart=restart, on_page=on_page)
+  console.print(f'[bold green]Exported {checkpoint["records"]} {kind} to '
+      f'{path}')
+
+
+@cli.command()
+@click.pass_context
+@click.option('--action',
+    default='charge',
+    type=click.Choice(['charge', 'pay']),
+    help='Which payments to watch')
+@click.option('--format', 'output_format',
+    default='table',
+    type=click.Choice(OUTPUT_FORMATS),
+    help='Output format')
+def changes(ctx: click.Context, action: str, output_format: str):
+  client = make_client(ctx, check_authentication=True)
+  columns = [
+      dict(header='Date', style='dim', width=8, min_width=8),
+      dict(header='Name', width=14),
+      dict(header='Amount', style='green', justify='right', width=10),
+      dict(header='Memo', width=16),
+      dict(header='Change', width=22),
+  ]
+
+  def to_row(change, plain):
+    payment = change.payment
+    if change.old is None:
+      what = f'new ({change.new.status})'
+    elif 'status' in change.fields:
+      what = f'{change.old.status} -> {change.new.status}'
+    else:
+      what = 'reminded'
+    user = payment.actor
+    if user.id == client.user_id and payment.target.user is not None:
+      user = payment.target.user
+    return (payment.date_created.strftime('%m/%d/%y'), user.display_name,
+        locale.currency(payment.amount), payment.note, what)
+
+  feed = client.changes(action)
+  stream_output(output_format, columns, feed.poll(client), to_row,
+      status='Checking for changes')
+
+
+@cli.command()
+@click.pass_context
+@click.option('--sync/--no-sync',
+    default=False,
+    help='Refresh open charges from Venmo before reporting')
+@click.option('--i-owe/--owed-to-me',
+    default=False,
+    help='Show charges you owe instead of charges owed to you')
+def owed(ctx: click.Context, sync: bool, i_owe: bool):
+  client = make_client(ctx, check_authentication=True)
+  ledger = client.ledger()
+  if sync or ledger.last_synced is None:
+    with console.status('Syncing open charges'):
+      ledger.sync(client)
+  columns = [
+      dict(header='Oldest', style='dim', width=8, min_width=8),
+      dict(header='Name', width=20),
+      dict(header='Amount', style='green', justify='right', width=10),
+      dict(header='Charges', justify='right', width=7),
+      dict(header='Age', width=10),
+      dict(header='Reminded', style='dim', width=8),
+  ]
+  rows = []
+  for balance in ledger.balances(owed_to_me=not i_owe):
+    last_reminded = (balance.last_reminded.strftime('%m/%d/%y')
+        if balance.last_reminded else '[red]Never[/red]')
+    rows.append((balance.oldest.strftime('%m/%d/%y'), balance.display_name,
+        locale.currency(abs(balance.amount_cents) / 100, grouping=True),
+        str(balance.charges), ledger_lib.age_bucket(balance.age_days),
+        last_reminded))
+  console.stream_table(columns, rows)
+  console.print(f'[dim]Last synced {ledger.last_synced}')
+
+
+@cli.command()
+@click.pass_context
+@click.argument('query', nargs=-1, required=True)
+@click.option('--sync/--no-sync',
+    default=False,
+    help='Pull new transactions into the index before searching')
+@click.option('--limit',
+    default=20,
+    help='Maximum number of results',
+    type=int)
+@click.option('--since',
+    default=None,
+    help='Only show transactions on or after this date (YYYY-MM-DD)')
+@click.option('--until',
+    default=None,
+    help='Only show transactions on or before this date (YYYY-MM-DD)')
+def search(ctx: click.Context, query: Sequence[str], sync: bool, limit: int,
+    since: Optional[str], until: Optional[str]):
+  client = make_client(ctx, check_authentication=True)
+  if sync or not len(client.search_index):
+    with console.status('Syncing transactions'):
+      client.sync_archive()
+  columns = [
+      dict(header='Date', style='dim', width=8, min_width=8),
+      dict(header='Name', width=20),
+      dict(header='Amount', style='green', justify='right', width=10),
+      dict(header='Memo', width=30),
+  ]
+  rows = []
+  for result in client.search(' '.join(query), limit=limit, start=since,
+      end=until):
+    amount = ('' if result.amount_cents is None
+        else locale.currency(result.amount_cents / 100, grouping=True))
+    rows.append((result.date.strftime('%m/%d/%y'), result.counterparty or '',
+        amount, result.note))
+  console.stream_table(columns, rows)
+
+
+@cli.command()
+@click.pass_context
+def daemon(ctx: click.Context):
+  client = make_client(ctx, check_authentication=False)
+  server = daemon_lib.Daemon(client, ctx.obj['config_dir'])
+  console.print(f'[bold green]Listening on {server.path}')
+  try:
+    server.serve()
+  except KeyboardInterrupt:
+    pass
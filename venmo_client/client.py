@@ -1,29 +1,94 @@
 import datetime
+import random
+import threading
+import time
 
-from typing import Optional, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import pathlib
 import requests
+from requests import adapters
 from rich import prompt
 import uuid
 import urllib.parse as urlparse
 
+from venmo_client import archive
 from venmo_client import auth
+from venmo_client import changes
+from venmo_client import codec
+from venmo_client import filters
+from venmo_client import ledger
 from venmo_client import model
+from venmo_client import outbox
+from venmo_client import paging
+from venmo_client import reconcile
+from venmo_client import search
+from venmo_client import singleflight
+from venmo_client import statements
 from venmo_client import util
 
 TRANSACTION_HISTORY_URL = 'https://venmo.com/transaction-history/statement?startDate={start_date}&endDate={end_date}&profileId={user_id}&accountType=personal'
 
+
+def _rejects_limit(res: requests.Response) -> bool:
+  # Venmo explains a 400 in `error.message`; only one that mentions `limit`
+  # says the page size itself was refused.
+  try:
+    error = codec.loads(res.content).get('error') or {}
+    return 'limit' in str(error.get('message', '')).lower()
+  except (ValueError, AttributeError):
+    return False
+
+
+class SessionPool:
+  # `requests.Session` isn't thread-safe, so each thread gets its own session
+  # the first time it sends a request. The sessions all mount one adapter,
+  # whose connection pools are thread-safe, so keep-alive connections are
+  # shared and `pool_maxsize` bounds how many are kept per host in total.
+
+  def __init__(self, pool_maxsize: int = 10):
+    self.adapter = adapters.HTTPAdapter(pool_maxsize=pool_maxsize)
+    self._local = threading.local()
+
+  @property
+  def session(self) -> requests.Session:
+    session = getattr(self._local, 'session', None)
+    if session is None:
+      session = requests.Session()
+      session.mount('https://', self.adapter)
+      session.mount('http://', self.adapter)
+      self._local.session = session
+    return session
+
+  def send(self, request: requests.PreparedRequest,
+      **kwargs) -> requests.Response:
+    return self.session.send(request, **kwargs)
+
+
 class VenmoClient:
+  # Safe to share between threads: connections are pooled per thread, the
+  # credentials in `auth_config` are locked, and lazily built state is
+  # created under `_lock`.
 
   def __init__(self,
       config_dir: Union[str, pathlib.Path],
       base_url: str = 'https://api.venmo.com/v1',
+      timeout: Optional[float] = None,
+      transport: Optional[Any] = None,
       ):
     self.base_url = base_url
-    self.session = requests.Session()
+    self.timeout = timeout
+    self.sessions = SessionPool()
+    # Anything with `requests.Session.send`'s signature, e.g. a
+    # `cassette.Recorder` or `cassette.Replayer`.
+    self.transport = transport or self.sessions
     self.auth_config = auth.Config(pathlib.Path(config_dir))
     self.device_id = str(uuid.uuid4())
+    self.inflight = singleflight.Group()
+    self._lock = threading.Lock()
+    self._archive = None
+    self._search_index = None
+    self.page_sizers: Dict[str, paging.PageSizer] = {}
 
   @property
   def user_id(self) -> str:
@@ -33,6 +98,48 @@ class VenmoClient:
   def access_token(self) -> str:
     return self.auth_config.get_access_token()
 
+  @property
+  def session(self) -> requests.Session:
+    return self.sessions.session
+
+  @property
+  def archive(self) -> archive.Archive:
+    with self._lock:
+      if self._archive is None:
+        self._archive = archive.Archive(
+            self.auth_config.config_dir / 'archive')
+      return self._archive
+
+  @property
+  def search_index(self) -> search.SearchIndex:
+    # `archive` takes `_lock` too, so it has to be built before we hold it.
+    archive_ = self.archive
+    with self._lock:
+      if self._search_index is None:
+        index = search.SearchIndex(
+            self.auth_config.config_dir / 'search.sqlite', self.user_id)
+        if not len(index):
+          # Catch up on anything archived before the index existed.
+          index.add(archive_.between('1970-01-01', '9999-12-31'))
+        self._search_index = index
+      return self._search_index
+
+  def search(self, query: str, **kwargs) -> List[search.Result]:
+    return self.search_index.search(query, **kwargs)
+
+  def ledger(self) -> ledger.Ledger:
+    return ledger.Ledger(self.auth_config.config_dir / 'ledger.json',
+        self.user_id)
+
+  def changes(self, action: str = 'charge') -> changes.ChangeFeed:
+    return changes.ChangeFeed(
+        self.auth_config.config_dir / f'changes-{action}.json', self.user_id,
+        action)
+
+  def outbox(self, **kwargs) -> outbox.Outbox:
+    return outbox.Outbox(self.auth_config.config_dir / 'outbox.sqlite', self,
+        **kwargs)
+
   def is_authenticated(self):
     return self.auth_config.is_authenticated()
 
@@ -43,19 +150,25 @@ class VenmoClient:
         headers=headers,
         params=params,
         json=payload).prepare()
-    return self.session.send(req)
+    return self.transport.send(req, timeout=self.timeout)
 
   def authenticate(self, *,
       username: str = None,
       password: str = None):
+    # Logging in may wait on the user for a two-factor code, so the
+    # credentials lock is only taken to store the result; if two threads log
+    # in at once, the first to finish wins.
     if self.auth_config.is_authenticated():
       return
     if not (username and password):
       raise ValueError('Need to provide username and password.')
     auth_json = self.login(username, password)
-    self.auth_config.save(
-        auth_json['user']['id'],
-        auth_json['access_token'])
+    with self.auth_config.lock:
+      if self.auth_config.is_authenticated():
+        return
+      self.auth_config.save(
+          auth_json['user']['id'],
+          auth_json['access_token'])
 
   def login(self, username: str, password: str) -> str:
     payload = dict(
@@ -70,15 +183,15 @@ class VenmoClient:
     url = f'{self.base_url}/oauth/access_token'
     res = self._make_request(url, 'POST', headers=headers, payload=payload)
     if res.status_code == 201:
-      return res.json()
+      return codec.loads(res.content)
     elif res.status_code == 401:
       venmo_otp_secret = res.headers['venmo-otp-secret']
       return self.login_with_text(username, password, venmo_otp_secret)
     else:
-      message = res.json()
+      message = codec.loads(res.content)
       if 'error' in message:
         raise ValueError(message['error']['message'])
-    raise NotImplementedError(res.json())
+    raise NotImplementedError(codec.loads(res.content))
 
   def login_with_text(self, username, password, secret):
     headers = {
@@ -102,27 +215,110 @@ class VenmoClient:
     res = self._make_request(url, 'POST', headers=headers, payload=payload)
     if res.status_code != 201:
       raise ValueError(res.status_code)
-    return res.json()
+    return codec.loads(res.content)
 
-  def transactions(self, before_id=None, limit: int = 50, **kwargs):
-    if not self.access_token:
-      raise ValueError('Need to authenticate.')
+  def page_sizer(self, endpoint: str) -> paging.PageSizer:
+    with self._lock:
+      if endpoint not in self.page_sizers:
+        initial, minimum, maximum = paging.PAGE_SIZE_BOUNDS[endpoint]
+        self.page_sizers[endpoint] = paging.PageSizer(initial, minimum,
+            maximum)
+      return self.page_sizers[endpoint]
+
+  def paginate(self, url: str, params: Dict[str, Any], *,
+      page_sizer: Optional[paging.PageSizer] = None,
+      max_items: Optional[int] = None,
+      retries: int = 3,
+      backoff: float = .5,
+      ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[Dict[str, str]]]]:
+    # Yields each page's raw records along with the params for the next page.
+    # Callers may update those params in place before asking for the next
+    # page, or persist them as a cursor and pass them back in to resume.
+    # With a `page_sizer` the `limit` of every request is chosen adaptively,
+    # and timeouts, server errors and rejected sizes retry with smaller pages.
+    # Timeouts and server errors also wait, `backoff` seconds doubling with
+    # each attempt, before retrying.
     headers = {
         'Authorization': f'Bearer {self.access_token}'
     }
+    seen, attempts = 0, 0
+    # A size that got a 400 not clearly about the limit; it is only known to
+    # be too big once a smaller page of the same request goes through.
+    suspect_size = None
+
+    def wait():
+      time.sleep(backoff * 2 ** attempts * (1 + random.random()))
+
+    while params is not None:
+      if page_sizer is not None:
+        params['limit'] = page_sizer.size
+      if max_items is not None:
+        params['limit'] = min(params.get('limit') or max_items,
+            max_items - seen)
+      start = time.perf_counter()
+      try:
+        res = self._make_request(url, 'GET', headers=headers, params=params)
+      except (requests.Timeout, requests.ConnectionError):
+        if page_sizer is None or attempts >= retries:
+          raise
+        page_sizer.failure()
+        wait()
+        attempts += 1
+        continue
+      if res.status_code != 200:
+        retryable = res.status_code == 400 or res.status_code >= 500
+        if page_sizer is None or not retryable or attempts >= retries:
+          raise ValueError(res.status_code)
+        if res.status_code >= 500:
+          wait()
+        elif _rejects_limit(res):
+          page_sizer.reject(params['limit'])
+        else:
+          suspect_size = params['limit']
+        page_sizer.failure()
+        attempts += 1
+        continue
+      if suspect_size is not None and params.get('limit', 0) < suspect_size:
+        page_sizer.reject(suspect_size)
+      attempts, suspect_size = 0, None
+      res = codec.loads(res.content)
+      data = res['data']
+      if max_items is not None:
+        # A replayed page may be longer than the `limit` asked for.
+        data = data[:max_items - seen]
+      if page_sizer is not None:
+        page_sizer.observe(len(data), time.perf_counter() - start)
+      pagination = res.get('pagination') or {}
+      next_params = None
+      if pagination.get('next'):
+        parsed_url = urlparse.urlparse(pagination['next'])
+        next_params = dict(urlparse.parse_qsl(parsed_url.query))
+      seen += len(data)
+      if max_items is not None and seen >= max_items:
+        next_params = None
+      yield data, next_params
+      params = next_params
+
+  def transactions(self, before_id=None, limit: Optional[int] = None,
+      where: Optional[filters.Filter] = None, **kwargs):
+    # `where` is checked against the raw records, so stories it rejects are
+    # never decoded.
+    if not self.access_token:
+      raise ValueError('Need to authenticate.')
     url = f'{self.base_url}/stories/target-or-actor/{self.user_id}'
     params = {
         'before_id': before_id,
         'limit': limit,
         **kwargs
     }
-    res = self._make_request(url, 'GET', headers=headers, params=params).json()
-    pagination = res['pagination']
-    parsed_url = urlparse.urlparse(pagination['next'])
-    qs = urlparse.parse_qs(parsed_url.query)
-    txns = (model.Transaction.new(**d) for d in res['data'])
-    yield txns
-    yield from self.transactions(**qs)
+    page_sizer = self.page_sizer('stories') if limit is None else None
+    for data, _ in self.paginate(url, params, page_sizer=page_sizer):
+      if where is not None:
+        yield (model.Transaction.new(**d) for d in data if where(d))
+        if where.exhausted(data):
+          return
+      else:
+        yield (model.Transaction.new(**d) for d in data)
 
   def logout(self):
     headers = {
@@ -139,78 +335,193 @@ class VenmoClient:
       return
     raise ValueError(f'Unable to logout: {res.text}')
 
-  def me(self):
+  def _shared_get(self, url: str, params: Dict[str, Any]):
+    # Identical GETs issued concurrently share one in-flight request.
     headers = {
         'Authorization': f'Bearer {self.access_token}'
     }
-    url = f'{self.base_url}/me'
-    res = self._make_request(url, 'GET', headers=headers)
-    if res.status_code == 200:
-      result = res.json()['data']
+    def fetch():
+      res = self._make_request(url, 'GET', headers=headers, params=params)
+      return res.status_code, codec.loads(res.content)
+    key = (url, tuple(sorted(params.items())), self.access_token)
+    return key, fetch
+
+  def _get_json(self, url: str, params: Dict[str, Any] = {}
+      ) -> Tuple[int, Any]:
+    return self.inflight.do(*self._shared_get(url, params))
+
+  async def _get_json_async(self, url: str, params: Dict[str, Any] = {}
+      ) -> Tuple[int, Any]:
+    return await self.inflight.do_async(*self._shared_get(url, params))
+
+  def stats(self) -> Dict[str, Any]:
+    return dict(
+        singleflight=self.inflight.stats(),
+        page_size={endpoint: sizer.stats()
+          for endpoint, sizer in list(self.page_sizers.items())})
+
+  def _parse_me(self, status_code, body):
+    if status_code == 200:
+      result = body['data']
       user = model.User(**result['user'])
       return dict(result, user=user)
 
+  def me(self):
+    return self._parse_me(*self._get_json(f'{self.base_url}/me'))
+
+  async def me_async(self):
+    return self._parse_me(*await self._get_json_async(f'{self.base_url}/me'))
+
   def balance(self):
     me = self.me()
     return float(me['balance'])
 
+  async def balance_async(self):
+    me = await self.me_async()
+    return float(me['balance'])
+
+  def _parse_user_id(self, status_code, body):
+    if status_code == 200:
+      return body['data']['id']
+    print(body)
+    raise ValueError(status_code)
+
   def get_user_id(self, username):
+    url = f'{self.base_url}/users/{username}'
+    return self._parse_user_id(*self._get_json(url))
+
+  async def get_user_id_async(self, username):
+    url = f'{self.base_url}/users/{username}'
+    return self._parse_user_id(*await self._get_json_async(url))
+
+  def get_transaction(self, transaction_id) -> model.Transaction:
+    txn = self.archive.get(transaction_id)
+    if txn is not None:
+      return txn
     headers = {
         'Authorization': f'Bearer {self.access_token}'
     }
-    url = f'{self.base_url}/users/{username}'
+    url = f'{self.base_url}/stories/{transaction_id}'
     res = self._make_request(url, 'GET', headers=headers)
     if res.status_code == 200:
-      return res.json()['data']['id']
-    print(res.json())
+      data = codec.loads(res.content)['data']
+      txn = model.Transaction.new(**data)
+      if self.archive.add(data):
+        self.search_index.add([txn])
+      return txn
+    print(codec.loads(res.content))
     raise ValueError(res.status_code)
 
-  def get_transaction(self, transaction_id):
+  def sync_archive(self, limit: int = 50) -> int:
+    # Pulls stories newest-first down to the newest one archived before the
+    # sync began, then, until the archive reaches the first story on the
+    # account, keeps backfilling from before the oldest archived story.
+    # Both crawls resume where an interrupted sync stopped: the crawl of newer
+    # stories checkpoints its cursor in the archive after every page, and the
+    # backfill starts from the oldest archived story.
+    url = f'{self.base_url}/stories/target-or-actor/{self.user_id}'
+    added = []
+
+    def archive_pages(params):
+      for data, _ in self.paginate(url, params):
+        for record in data:
+          if not self.archive.add(record):
+            return False
+          added.append(model.Transaction.new(**record))
+      return True
+
+    def crawl_newer(crawl):
+      # `until` is the creation time of the newest story archived when the
+      # crawl began; stories already archived above it were added by this
+      # same crawl before an interruption and are skipped over.
+      self.archive.save_crawl(crawl)
+      params = dict(limit=limit, before_id=crawl['before_id'])
+      for data, _ in self.paginate(url, params):
+        for record in data:
+          if self.archive.add(record):
+            added.append(model.Transaction.new(**record))
+          elif (crawl['until'] is not None
+              and record['datetime_created'] <= crawl['until']):
+            self.archive.save_crawl(None)
+            return
+        if data:
+          self.archive.save_crawl(dict(crawl, before_id=data[-1]['id']))
+      # Ran off the end of the listing, so nothing is missing below either.
+      self.archive.mark_complete()
+      self.archive.save_crawl(None)
+
+    try:
+      if self.archive.crawl is not None:
+        crawl_newer(self.archive.crawl)
+      newest = self.archive.newest()
+      crawl_newer(dict(before_id=None,
+          until=newest and newest['datetime_created']))
+      while not self.archive.complete:
+        oldest = self.archive.oldest()
+        if not archive_pages(dict(limit=limit, before_id=oldest['id'])):
+          # The listing returned a story we already have; nothing older
+          # can be reached from here.
+          break
+        self.archive.mark_complete()
+      return len(added)
+    finally:
+      self.search_index.add(added)
+
+  @property
+  def statements(self) -> statements.StatementCache:
+    return statements.StatementCache(
+        self.auth_config.config_dir / 'statements', self.user_id,
+        self._fetch_statement)
+
+  def _fetch_statement(self, start_date: datetime.date,
+      end_date: datetime.date) -> Dict[str, Any]:
+    url = f'{self.base_url}/transaction-history'
     headers = {
         'Authorization': f'Bearer {self.access_token}'
     }
-    url = f'{self.base_url}/stories/{transaction_id}'
-    res = self._make_request(url, 'GET', headers=headers)
-    if res.status_code == 200:
-      return res.json()['data']
-    print(res.json())
-    raise ValueError(res.status_code)
+    params = {
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        'profile_id': self.user_id,
+        'account_type': 'personal'
+    }
+    res = self._make_request(url, 'GET', headers=headers, params=params)
+    if res.status_code != 200:
+      print(codec.loads(res.content))
+      raise ValueError(res.status_code)
+    return codec.loads(res.content)['data']
 
   def get_transaction_history(
       self,
       *,
       start_date: Optional[Union[str, datetime.date]] = None,
       end_date: Optional[Union[str, datetime.date]] = None):
+    # Served from the month-partitioned statement cache, so only months that
+    # haven't been seen yet and the current month hit the network, in at most
+    # one request. The balances are the server's only when the range runs
+    # from the first of a month to the end of a month (or today) and a single
+    # statement covers it. Otherwise, including the default 90 days, they
+    # are derived: a statement's balance plus `reconcile.signed_cents` of the
+    # transactions between its boundary and the range's. That is only as
+    # accurate as `signed_cents`' reading of each transaction type.
     if not start_date:
       start_date = datetime.date.today() - datetime.timedelta(days=90)
     if not end_date:
       end_date = datetime.date.today()
     start_date = util.canonicalize_date(start_date)
     end_date = util.canonicalize_date(end_date)
-    start_date_str = start_date.strftime('%Y-%m-%d')
-    end_date_str = end_date.strftime('%Y-%m-%d')
-    url = f'{self.base_url}/transaction-history'
-    headers = {
-        'Authorization': f'Bearer {self.access_token}'
-    }
-    params = {
-        'start_date': start_date_str,
-        'end_date': end_date_str,
-        'profile_id': self.user_id,
-        'account_type': 'personal'
-    }
-    res = self._make_request(url, 'GET', headers=headers, params=params)
-    if res.status_code != 200:
-      print(res.json())
-      raise ValueError(res.status_code)
-    results = res.json()
-    start_balance = results['data']['start_balance']
-    end_balance = results['data']['end_balance']
-    transactions = results['data']['transactions']
-    parsed_transactions = []
-    for txn in transactions:
-      parsed_transactions.append(model.Transaction.new(**txn))
-    return parsed_transactions, (start_balance, end_balance)
+    return self.statements.get(start_date, end_date)
+
+  def reconcile(
+      self,
+      *,
+      start_date: Optional[Union[str, datetime.date]] = None,
+      end_date: Optional[Union[str, datetime.date]] = None
+      ) -> reconcile.Reconciliation:
+    transactions, (start_balance, end_balance) = self.get_transaction_history(
+        start_date=start_date, end_date=end_date)
+    return reconcile.reconcile(transactions, self.user_id, start_balance,
+        end_balance, start=start_date, end=end_date)
 #
   def request(self, note, username, amount):
     user_id = self.get_user_id(username)
@@ -225,63 +536,55 @@ class VenmoClient:
     url = f'{self.base_url}/payments'
     res = self._make_request(url, 'POST', headers=headers, payload=payload)
     if res.status_code != 200:
-      print(res.json())
+      print(codec.loads(res.content))
       raise ValueError(res.status_code)
-    return
+    return codec.loads(res.content)
 
-  def payments(self, action='charge', status=(), limit=None, before=None):
-    headers = {
-        'Authorization': f'Bearer {self.access_token}'
-    }
+  def payments(self, action='charge', status=(), limit=None, before=None,
+      where: Optional[filters.Filter] = None):
     url = f'{self.base_url}/payments'
     params = {
         'action': action,
         'status': ','.join(status),
-        'limit': limit,
         'before': before
     }
-    res = self._make_request(url, 'GET', headers=headers, params=params)
-    if res.status_code != 200:
-      raise ValueError(res.status_code)
-    res = res.json()
-    data = res['data']
-    for txn in data:
-      yield model.Payment.new(**txn)
-    pagination = res['pagination']
-    if pagination:
-      parsed_url = urlparse.urlparse(pagination['next'])
-      qs = urlparse.parse_qs(parsed_url.query)
-      limit = int(qs.pop('limit')[0])
-      if limit - len(data) > 0:
-        yield from self.payments(**qs, status=status, limit=limit - len(data))
-
-  def notifications(self, limit = None):
+    pages = self.paginate(url, params, page_sizer=self.page_sizer('payments'),
+        max_items=limit)
+    for data, next_params in pages:
+      for txn in data:
+        if where is None or where(txn):
+          yield model.Payment.new(**txn)
+      if where is not None and where.exhausted(data):
+        return
+      if next_params is not None:
+        next_params.update(status=','.join(status))
+
+  def get_payment(self, payment_id: str) -> model.Payment:
     headers = {
         'Authorization': f'Bearer {self.access_token}'
     }
+    url = f'{self.base_url}/payments/{payment_id}'
+    res = self._make_request(url, 'GET', headers=headers)
+    if res.status_code != 200:
+      raise ValueError(res.status_code)
+    return model.Payment.new(**codec.loads(res.content)['data'])
+
+  def notifications(self, limit = None,
+      where: Optional[filters.Filter] = None):
     url = f'{self.base_url}/notifications'
     params = {
-        'limit': limit,
         'status': 'incoming',
     }
-    res = self._make_request(url, 'GET', headers=headers, params=params)
-    if res.status_code != 200:
-      raise ValueError(res.status_code)
-    res = res.json()
-    data = res['data']
-    for txn in data:
-      txn = model.Notification.new(**txn)
-      if txn.type == 'venmo_card_shipped':
-        continue
-      yield txn
-
-    pagination = res['pagination']
-    if 'next' in pagination:
-      parsed_url = urlparse.urlparse(pagination['next'])
-      qs = urlparse.parse_qs(parsed_url.query)
-      limit = int(qs.pop('limit')[0])
-      if limit - len(data) > 0:
-        yield from self.payments(**qs, limit=limit - len(data))
+    pages = self.paginate(url, params,
+        page_sizer=self.page_sizer('notifications'), max_items=limit)
+    for data, _ in pages:
+      for txn in data:
+        if txn['type'] == 'venmo_card_shipped':
+          continue
+        if where is None or where(txn):
+          yield model.Notification.new(**txn)
+      if where is not None and where.exhausted(data):
+        return
 
   def settle(self, payment_id: str):
     headers = {
@@ -297,5 +600,6 @@ class VenmoClient:
     if res.status_code != 200:
       print(res.text)
       raise ValueError(res.status_code)
-    res = res.json()
+    res = codec.loads(res.content)
     print(res)
+    return res
@@ -0,0 +1,133 @@
+import json
+import sys
+import time
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Union
+
+__all__ = [
+    'BACKENDS',
+    'Codec',
+    'available',
+    'benchmark',
+    'dumps',
+    'get',
+    'loads',
+    'use',
+]
+
+# In order of preference.
+BACKENDS = ('orjson', 'msgspec', 'json')
+
+
+class Codec(NamedTuple):
+  name: str
+  # Accepts `bytes` as well as `str`, so response bodies never need decoding
+  # to text first.
+  loads: Callable[[Union[bytes, str]], Any]
+  dumps: Callable[[Any], bytes]
+  # Whether `loads` also takes a `memoryview` without copying it first.
+  buffers: bool = False
+
+
+def _orjson() -> Codec:
+  import orjson
+  return Codec('orjson', orjson.loads, orjson.dumps, buffers=True)
+
+
+def _msgspec() -> Codec:
+  import msgspec
+  decoder, encoder = msgspec.json.Decoder(), msgspec.json.Encoder()
+  def loads(data):
+    try:
+      return decoder.decode(data)
+    except msgspec.DecodeError as e:
+      # Every other backend raises a `ValueError`.
+      raise ValueError(str(e)) from e
+  return Codec('msgspec', loads, encoder.encode, buffers=True)
+
+
+def _json() -> Codec:
+  return Codec('json', json.loads, lambda obj: json.dumps(obj).encode('utf-8'))
+
+
+_FACTORIES: Dict[str, Callable[[], Codec]] = {
+    'orjson': _orjson,
+    'msgspec': _msgspec,
+    'json': _json,
+}
+_codec: Optional[Codec] = None
+
+
+def available() -> List[str]:
+  names = []
+  for name in BACKENDS:
+    try:
+      _FACTORIES[name]()
+    except ImportError:
+      continue
+    names.append(name)
+  return names
+
+
+def use(name: Optional[str] = None) -> Codec:
+  # Switches every `loads` and `dumps` in the client to the named backend, or
+  # to the fastest one installed.
+  global _codec
+  if name is None:
+    name = available()[0]
+  if name not in _FACTORIES:
+    raise ValueError(f'Unknown JSON backend: {name}')
+  try:
+    _codec = _FACTORIES[name]()
+  except ImportError:
+    raise ValueError(f'JSON backend `{name}` is not installed.')
+  return _codec
+
+
+def get() -> Codec:
+  return _codec or use()
+
+
+def loads(data: Union[bytes, str]) -> Any:
+  return get().loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+  return get().dumps(obj)
+
+
+def benchmark(data: bytes, repeat: int = 20) -> Dict[str, Dict[str, float]]:
+  # Seconds per call of each installed backend on `data`, best of `repeat`.
+  results = {}
+  for name in available():
+    codec = _FACTORIES[name]()
+    obj = codec.loads(data)
+    timings = {}
+    for op, fn, arg in (('loads', codec.loads, data),
+        ('dumps', codec.dumps, obj)):
+      best = float('inf')
+      for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+      timings[op] = best
+    results[name] = timings
+  return results
+
+
+if __name__ == '__main__':
+  # python -m venmo_client.codec [RESPONSE.json | COUNT]
+  # Best run on a real response body, e.g. one saved from a `--record`
+  # cassette, since relative speed depends heavily on the payload; otherwise
+  # times a `/stories` page of COUNT (default 50000) synthetic stories.
+  from venmo_client import decode
+  source = sys.argv[1] if len(sys.argv) > 1 else '50000'
+  if source.isdigit():
+    payload = dumps(dict(data=decode._synthetic_stories(int(source))))
+  else:
+    with open(source, 'rb') as fp:
+      payload = fp.read()
+  print(f'{len(payload) / 1e6:.2f} MB')
+  for name, timings in benchmark(payload).items():
+    print(f'{name:8} loads {timings["loads"] * 1e3:8.2f} ms  '
+        f'dumps {timings["dumps"] * 1e3:8.2f} ms')
@@ -1,8 +1,11 @@
+import contextlib
 import sys
 
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List, Sequence
 
+from rich import box
 from rich import console as cs
+from rich import table
 
 console = cs.Console()
 
@@ -22,4 +25,34 @@ def error(message: str):
 def json(data: Dict[str, Any]):
   return console.print(data)
 
+def stream_table(columns: List[Dict[str, Any]],
+    rows: Iterable[Sequence[str]]):
+  # Each row is rendered as its own headerless table with fixed column widths,
+  # so rows show up as soon as they are decoded and nothing is retained.
+  show_header = True
+  for row in rows:
+    console.print(_table(columns, show_header, row))
+    show_header = False
+  if show_header:
+    console.print(_table(columns, show_header))
+
+def _table(columns, show_header, row=None):
+  tab = table.Table(show_header=show_header, header_style='bold',
+      box=box.SIMPLE_HEAD, show_edge=False)
+  for column in columns:
+    tab.add_column(**column)
+  if row is not None:
+    tab.add_row(*row)
+  return tab
+
+@contextlib.contextmanager
+def redirect(file, **kwargs):
+  # Sends everything printed through this module to `file` for the duration.
+  global console
+  previous, console = console, cs.Console(file=file, **kwargs)
+  try:
+    yield console
+  finally:
+    console = previous
+
 pager = console.pager
@@ -0,0 +1,128 @@
+import contextlib
+import io
+import json
+import os
+import pathlib
+import socket
+import threading
+import traceback
+
+from typing import Any, Dict, Optional, Union
+
+import click
+
+from venmo_client import launcher
+
+__all__ = [
+    'Daemon',
+]
+
+
+class _SocketWriter(io.TextIOBase):
+  # A text stream that forwards every write to the launcher as it happens, so
+  # streamed tables show up row by row on the other end.
+
+  def __init__(self, sock: socket.socket):
+    self.sock = sock
+    self._lock = threading.Lock()
+
+  def writable(self) -> bool:
+    return True
+
+  def isatty(self) -> bool:
+    return False
+
+  def _send(self, message: Dict[str, Any]):
+    with self._lock:
+      self.sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+  def write(self, text: str) -> int:
+    if text:
+      self._send(dict(out=text))
+    return len(text)
+
+
+class Daemon:
+  # Serves `launcher.FORWARDED_COMMANDS` over a Unix socket in the config
+  # directory with one long-lived client, so its pooled connections, page
+  # sizes, archive and in-flight requests carry over from one command to the
+  # next. Commands run one at a time since output is redirected globally.
+
+  def __init__(self, client, config_dir: Union[str, pathlib.Path]):
+    self.client = client
+    self.path = pathlib.Path(config_dir) / launcher.SOCKET_NAME
+    self._sock: Optional[socket.socket] = None
+
+  def _bind(self) -> socket.socket:
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with probe:
+      try:
+        probe.connect(str(self.path))
+      except OSError:
+        pass
+      else:
+        raise ValueError(f'A daemon is already listening on {self.path}')
+    # Left behind by a daemon that didn't shut down cleanly.
+    with contextlib.suppress(FileNotFoundError):
+      self.path.unlink()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(str(self.path))
+    os.chmod(self.path, 0o600)
+    sock.listen()
+    return sock
+
+  def _run(self, request: Dict[str, Any], out: _SocketWriter) -> int:
+    from venmo_client import cli
+    from venmo_client import console
+    # `venmo login` and `venmo logout` run in-process and may have changed
+    # the credentials since the last command.
+    self.client.auth_config.reload()
+    with console.redirect(out, width=request.get('width'),
+        force_terminal=request.get('terminal', False)) as captured:
+      with contextlib.redirect_stdout(out):
+        try:
+          cli.cli.main(args=request['argv'], prog_name='venmo',
+              obj=dict(client=self.client), standalone_mode=False)
+        except click.exceptions.Exit as e:
+          return e.exit_code
+        except click.ClickException as e:
+          e.show(file=out)
+          return e.exit_code
+        except click.Abort:
+          captured.print('Aborted!')
+          return 1
+        except SystemExit as e:
+          return e.code if isinstance(e.code, int) else 1
+        except Exception:
+          captured.print(traceback.format_exc(), markup=False, highlight=False)
+          return 1
+    return 0
+
+  def _handle(self, conn: socket.socket):
+    with conn, conn.makefile('rb') as fp:
+      line = fp.readline()
+      if not line:
+        return
+      out = _SocketWriter(conn)
+      code = self._run(json.loads(line), out)
+      out._send(dict(exit=code))
+
+  def serve(self):
+    self._sock = self._bind()
+    try:
+      while True:
+        conn, _ = self._sock.accept()
+        try:
+          self._handle(conn)
+        except OSError:
+          # The launcher went away mid-command.
+          pass
+    finally:
+      self.close()
+
+  def close(self):
+    if self._sock is not None:
+      self._sock.close()
+      self._sock = None
+      with contextlib.suppress(FileNotFoundError):
+        self.path.unlink()
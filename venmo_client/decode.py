@@ -0,0 +1,174 @@
+import collections
+import concurrent.futures as futures
+import datetime
+import functools
+import itertools
+import json
+import os
+import sys
+import time
+
+from typing import (Any, Dict, Iterable, Iterator, List, NamedTuple, Optional,
+    Tuple, Union)
+
+from venmo_client import model
+from venmo_client import util
+
+__all__ = [
+    'Row',
+    'benchmark',
+    'decode',
+    'decode_pages',
+]
+
+Record = Dict[str, Any]
+
+MODELS = {
+    'transaction': model.Transaction,
+    'payment': model.Payment,
+    'notification': model.Notification,
+}
+
+
+class Row(NamedTuple):
+  id: str
+  type: str
+  datetime_created: Optional[datetime.datetime]
+  amount_cents: Optional[int]
+  note: str
+
+
+def _row(kind: str, item: Any) -> Row:
+  if kind == 'transaction':
+    return Row(item.id, item.type, item.datetime_created,
+        util.to_cents(item.amount), item.note)
+  if kind == 'payment':
+    return Row(item.id, item.action, item.date_created,
+        util.to_cents(item.amount), item.note)
+  return Row(item.id, item.type, item.date_created, None, item.message)
+
+
+def _decode_chunk(kind: str, compact: bool, records: List[Record]) -> List[Any]:
+  cls = MODELS[kind]
+  items = [cls.new(**record) for record in records]
+  if compact:
+    return [_row(kind, item) for item in items]
+  return items
+
+
+def _chunks(records: Iterable[Record], chunk_size: int) -> Iterator[List[Record]]:
+  records = iter(records)
+  while True:
+    chunk = list(itertools.islice(records, chunk_size))
+    if not chunk:
+      return
+    yield chunk
+
+
+def decode(records: Iterable[Record],
+    kind: str = 'transaction',
+    *,
+    workers: Optional[int] = None,
+    chunk_size: int = 500,
+    compact: bool = False) -> Iterator[Union[Any, Row]]:
+  # Decodes raw API records across a process pool, yielding results in input
+  # order. At most two chunks per worker are in flight, so memory stays
+  # bounded no matter how long the input is.
+  if kind not in MODELS:
+    raise ValueError(f'Unknown record kind: {kind}')
+  workers = workers or os.cpu_count() or 1
+  decode_chunk = functools.partial(_decode_chunk, kind, compact)
+  chunks = _chunks(records, chunk_size)
+  if workers == 1:
+    for chunk in chunks:
+      yield from decode_chunk(chunk)
+    return
+  with futures.ProcessPoolExecutor(workers) as pool:
+    pending = collections.deque(pool.submit(decode_chunk, chunk)
+        for chunk in itertools.islice(chunks, workers * 2))
+    while pending:
+      results = pending.popleft().result()
+      for chunk in itertools.islice(chunks, 1):
+        pending.append(pool.submit(decode_chunk, chunk))
+      yield from results
+
+
+def decode_pages(pages: Iterable[List[Record]],
+    kind: str = 'transaction',
+    **kwargs) -> Iterator[Union[Any, Row]]:
+  return decode(itertools.chain.from_iterable(pages), kind, **kwargs)
+
+
+def _user(user_id: str) -> Record:
+  return dict(id=user_id, username=f'user{user_id}', first_name='First',
+      last_name='Last', display_name=f'User {user_id}', about='',
+      profile_picture_url='', friends_count=10, is_group=False,
+      is_active=True, trust_request=None, is_blocked=False, identity=None,
+      date_joined='2015-01-01T00:00:00', friend_status='friend',
+      is_payable=True, identity_type='personal')
+
+
+def _synthetic_stories(count: int) -> List[Record]:
+  # Payment stories shaped like `/stories` responses, for benchmarking
+  # without an account.
+  start = datetime.datetime(2020, 1, 1)
+  stories = []
+  for i in range(count):
+    when = (start + datetime.timedelta(minutes=i)).isoformat()
+    payment = dict(id=f'p{i}', status='settled', action='pay',
+        actor=_user('1'), target=dict(type='user', phone=None, email=None,
+            redeemable_target=None, user=_user(str(2 + i % 50))),
+        note='dinner', amount=12.5, audience='private', date_created=when,
+        date_completed=when, date_authorized=None, date_reminded=None,
+        external_wallet_payment_info=None)
+    stories.append(dict(type='payment', id=f's{i}', datetime_created=when,
+        note='dinner', amount=12.5, payment=payment))
+  return stories
+
+
+def _cassette_stories(path: str) -> List[Record]:
+  # Every story in the recorded `/stories` responses of a cassette.
+  stories = []
+  with open(path, 'r') as fp:
+    for line in fp:
+      entry = json.loads(line)
+      if '/stories/' not in entry.get('url', '') or not entry.get('body'):
+        continue
+      stories.extend(json.loads(entry['body']).get('data') or [])
+  return stories
+
+
+def benchmark(records: List[Record],
+    kind: str = 'transaction',
+    *,
+    max_workers: Optional[int] = None,
+    chunk_size: int = 500) -> Dict[Tuple[bool, int], float]:
+  # Records decoded per second for every `(compact, workers)` pair, with
+  # workers from 1 to `max_workers`. Pool startup is included, as it is for
+  # any real call.
+  results = {}
+  for compact in (True, False):
+    for workers in range(1, (max_workers or os.cpu_count() or 1) + 1):
+      start = time.perf_counter()
+      for _ in decode(records, kind, workers=workers, chunk_size=chunk_size,
+          compact=compact):
+        pass
+      results[compact, workers] = len(records) / (time.perf_counter() - start)
+  return results
+
+
+if __name__ == '__main__':
+  # python -m venmo_client.decode [CASSETTE.jsonl | COUNT] [MAX_WORKERS]
+  # With a cassette recorded via `--record`, decodes the stories it captured;
+  # otherwise decodes COUNT (default 50000) synthetic stories.
+  source = sys.argv[1] if len(sys.argv) > 1 else '50000'
+  records = (_synthetic_stories(int(source)) if source.isdigit()
+      else _cassette_stories(source))
+  if not records:
+    sys.exit(f'No stories in {source}')
+  max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+  print(f'{len(records)} records')
+  for (compact, workers), rate in benchmark(records,
+      max_workers=max_workers).items():
+    mode = 'compact' if compact else 'full'
+    print(f'{mode:8} workers {workers:3}  {rate:12,.0f} records/s')
@@ -0,0 +1,225 @@
+import csv
+import io
+import json
+import os
+import pathlib
+
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from venmo_client import client as vc
+from venmo_client import codec
+
+__all__ = [
+    'EXPORT_FORMATS',
+    'EXPORT_KINDS',
+    'Exporter',
+]
+
+EXPORT_KINDS = ('stories', 'payments', 'notifications')
+EXPORT_FORMATS = ('jsonl', 'csv', 'parquet')
+
+Record = Dict[str, Any]
+
+
+def _username(party: Optional[Record]) -> Optional[str]:
+  if not party:
+    return None
+  user = party.get('user', party)
+  return user and user.get('username')
+
+
+# Flat columns for the tabular formats; JSONL keeps the raw records.
+COLUMNS: Dict[str, Dict[str, Callable[[Record], Any]]] = {
+    'stories': dict(
+        id=lambda r: r['id'],
+        datetime_created=lambda r: r['datetime_created'],
+        type=lambda r: r['type'],
+        amount=lambda r: r['amount'],
+        note=lambda r: r['note'],
+    ),
+    'payments': dict(
+        id=lambda r: r['id'],
+        date_created=lambda r: r['date_created'],
+        action=lambda r: r['action'],
+        status=lambda r: r['status'],
+        amount=lambda r: r['amount'],
+        note=lambda r: r['note'],
+        actor=lambda r: _username(r.get('actor')),
+        target=lambda r: _username(r.get('target')),
+    ),
+    'notifications': dict(
+        id=lambda r: r['id'],
+        date_created=lambda r: r.get('date_created'),
+        type=lambda r: r['type'],
+        message=lambda r: r['message'],
+    ),
+}
+
+
+class JsonlWriter:
+
+  def __init__(self, path: pathlib.Path, kind: str):
+    self.path = path
+    self.fp = None
+
+  def open(self, position: int):
+    mode = 'r+b' if position and self.path.exists() else 'wb'
+    self.fp = self.path.open(mode)
+    # Anything past the last checkpoint is a partially written page.
+    self.fp.truncate(position)
+    self.fp.seek(position)
+
+  def _encode(self, records: List[Record]) -> bytes:
+    return b''.join(codec.dumps(r) + b'\n' for r in records)
+
+  def write(self, records: List[Record]) -> int:
+    self.fp.write(self._encode(records))
+    self.fp.flush()
+    os.fsync(self.fp.fileno())
+    return self.fp.tell()
+
+  def close(self):
+    if self.fp is not None:
+      self.fp.close()
+
+
+class CsvWriter(JsonlWriter):
+
+  def __init__(self, path: pathlib.Path, kind: str):
+    super().__init__(path, kind)
+    self.columns = COLUMNS[kind]
+
+  def _encode(self, records: List[Record]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if self.fp.tell() == 0:
+      writer.writerow(self.columns)
+    for record in records:
+      writer.writerow([column(record) for column in self.columns.values()])
+    return buffer.getvalue().encode('utf-8')
+
+
+class ParquetWriter:
+  # Parquet files can't be appended to, so each page becomes its own part file
+  # in `path` and the checkpoint position counts finished parts.
+
+  def __init__(self, path: pathlib.Path, kind: str):
+    try:
+      import pyarrow
+      import pyarrow.parquet
+    except ImportError:
+      raise ValueError('Parquet export requires `pyarrow` to be installed.')
+    self.pyarrow = pyarrow
+    self.path = path
+    self.columns = COLUMNS[kind]
+    self.parts = 0
+
+  def open(self, position: int):
+    self.path.mkdir(parents=True, exist_ok=True)
+    self.parts = position
+    for part in self.path.glob('part-*.parquet'):
+      if int(part.stem.split('-')[1]) >= position:
+        part.unlink()
+
+  def write(self, records: List[Record]) -> int:
+    table = self.pyarrow.table({
+        name: [column(record) for record in records]
+        for name, column in self.columns.items()})
+    part = self.path / f'part-{self.parts:05d}.parquet'
+    tmp = part.with_suffix('.tmp')
+    self.pyarrow.parquet.write_table(table, str(tmp))
+    os.replace(tmp, part)
+    self.parts += 1
+    return self.parts
+
+  def close(self):
+    pass
+
+
+WRITERS = {
+    'jsonl': JsonlWriter,
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
+
+
+class Exporter:
+
+  def __init__(self,
+      client: vc.VenmoClient,
+      kind: str,
+      path: Union[str, pathlib.Path],
+      output_format: str = 'jsonl',
+      page_size: int = 50):
+    if kind not in EXPORT_KINDS:
+      raise ValueError(f'Unknown export kind: {kind}')
+    if output_format not in EXPORT_FORMATS:
+      raise ValueError(f'Unknown export format: {output_format}')
+    self.client = client
+    self.kind = kind
+    self.path = pathlib.Path(path)
+    self.output_format = output_format
+    self.page_size = page_size
+    self.checkpoint_file = self.path.with_name(self.path.name + '.checkpoint')
+
+  def _start(self) -> Dict[str, Any]:
+    base_url = self.client.base_url
+    if self.kind == 'stories':
+      url = f'{base_url}/stories/target-or-actor/{self.client.user_id}'
+      params = dict(limit=self.page_size)
+    elif self.kind == 'payments':
+      url = f'{base_url}/payments'
+      params = dict(limit=self.page_size)
+    else:
+      url = f'{base_url}/notifications'
+      params = dict(limit=self.page_size, status='incoming')
+    return dict(kind=self.kind, format=self.output_format, url=url,
+        params=params, position=0, records=0, pages=0, done=False)
+
+  def load_checkpoint(self) -> Optional[Dict[str, Any]]:
+    if not self.checkpoint_file.exists():
+      return None
+    with self.checkpoint_file.open('r') as fp:
+      checkpoint = json.load(fp)
+    if (checkpoint['kind'], checkpoint['format']) != (self.kind,
+        self.output_format):
+      raise ValueError(f'{self.checkpoint_file} belongs to a '
+          f'{checkpoint["format"]} export of {checkpoint["kind"]}')
+    return checkpoint
+
+  def _save_checkpoint(self, checkpoint: Dict[str, Any]):
+    tmp = self.checkpoint_file.with_name(self.checkpoint_file.name + '.tmp')
+    with tmp.open('w') as fp:
+      json.dump(checkpoint, fp)
+      fp.flush()
+      os.fsync(fp.fileno())
+    os.replace(tmp, self.checkpoint_file)
+
+  def run(self, restart: bool = False,
+      on_page: Optional[Callable[[Dict[str, Any]], None]] = None
+      ) -> Dict[str, Any]:
+    checkpoint = None if restart else self.load_checkpoint()
+    if checkpoint is None:
+      checkpoint = self._start()
+    if checkpoint['done']:
+      return checkpoint
+    writer = WRITERS[self.output_format](self.path, self.kind)
+    writer.open(checkpoint['position'])
+    try:
+      pages = self.client.paginate(checkpoint['url'], checkpoint['params'])
+      for data, next_params in pages:
+        if not data:
+          next_params = None
+        checkpoint['position'] = writer.write(data)
+        checkpoint['records'] += len(data)
+        checkpoint['pages'] += 1
+        checkpoint['params'] = next_params
+        checkpoint['done'] = next_params is None
+        self._save_checkpoint(checkpoint)
+        if on_page is not None:
+          on_page(checkpoint)
+        if checkpoint['done']:
+          break
+    finally:
+      writer.close()
+    return checkpoint
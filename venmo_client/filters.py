@@ -0,0 +1,121 @@
+import datetime
+
+from typing import Any, Callable, Collection, Dict, List, Optional, Union
+
+__all__ = [
+    'Filter',
+    'between',
+    'counterparty',
+    'eq',
+    'is_in',
+]
+
+Record = Dict[str, Any]
+Date = Union[str, datetime.date, datetime.datetime]
+
+
+def _datetime(value: Date) -> datetime.datetime:
+  if isinstance(value, str):
+    value = datetime.datetime.fromisoformat(value)
+  if not isinstance(value, datetime.datetime):
+    value = datetime.datetime.combine(value, datetime.time())
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=datetime.timezone.utc)
+  return value
+
+
+def _created(record: Record) -> Optional[datetime.datetime]:
+  # Stories have `datetime_created`; payments and notifications have
+  # `date_created`.
+  value = record.get('datetime_created') or record.get('date_created')
+  return _datetime(value) if value else None
+
+
+def _lookup(record: Record, field: str) -> Any:
+  # `field` may be a dotted path into nested objects, e.g. `payment.status`;
+  # a missing step gives None.
+  value: Any = record
+  for key in field.split('.'):
+    if not isinstance(value, dict):
+      return None
+    value = value.get(key)
+  return value
+
+
+def _payment(record: Record) -> Optional[Record]:
+  if 'actor' in record:
+    return record
+  return record.get('payment')
+
+
+class Filter:
+  # A predicate over raw API records, checked before any model is built.
+  # Filters combine with `&`, `|` and `~`. `since` is the oldest creation date
+  # that can still match, which lets newest-first listings stop paginating as
+  # soon as a page ends before it.
+
+  def __init__(self, predicate: Callable[[Record], bool],
+      since: Optional[datetime.datetime] = None):
+    self.predicate = predicate
+    self.since = since
+
+  def __call__(self, record: Record) -> bool:
+    return self.predicate(record)
+
+  def __and__(self, other: 'Filter') -> 'Filter':
+    bounds = [f.since for f in (self, other) if f.since is not None]
+    return Filter(lambda record: self(record) and other(record),
+        max(bounds) if bounds else None)
+
+  def __or__(self, other: 'Filter') -> 'Filter':
+    since = None
+    if self.since is not None and other.since is not None:
+      since = min(self.since, other.since)
+    return Filter(lambda record: self(record) or other(record), since)
+
+  def __invert__(self) -> 'Filter':
+    return Filter(lambda record: not self(record))
+
+  def exhausted(self, page: List[Record]) -> bool:
+    # Pages are newest first, so once one ends before `since` no later page
+    # can match.
+    if self.since is None or not page:
+      return False
+    created = _created(page[-1])
+    return created is not None and created < self.since
+
+
+def eq(field: str, value: Any) -> Filter:
+  return Filter(lambda record: _lookup(record, field) == value)
+
+
+def is_in(field: str, values: Collection[Any]) -> Filter:
+  values = frozenset(values)
+  return Filter(lambda record: _lookup(record, field) in values)
+
+
+def counterparty(username: str) -> Filter:
+  # Matches stories and payments where `username` is either side.
+  def predicate(record: Record) -> bool:
+    payment = _payment(record)
+    if payment is None:
+      return False
+    if (payment.get('actor') or {}).get('username') == username:
+      return True
+    return ((payment.get('target') or {}).get('user') or {}).get(
+        'username') == username
+  return Filter(predicate)
+
+
+def between(since: Optional[Date] = None, until: Optional[Date] = None
+    ) -> Filter:
+  # `since` is inclusive and `until` exclusive; a bare date means midnight UTC.
+  start = _datetime(since) if since is not None else None
+  end = _datetime(until) if until is not None else None
+  def predicate(record: Record) -> bool:
+    created = _created(record)
+    if created is None:
+      return False
+    return ((start is None or created >= start)
+        and (end is None or created < end))
+  return Filter(predicate, start)
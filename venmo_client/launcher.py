@@ -0,0 +1,100 @@
+import json
+import os
+import socket
+import sys
+
+from typing import List, Optional
+
+# Imports nothing beyond the standard library, so that a command served by
+# `venmo daemon` doesn't pay for `requests`, `rich` or `click` at startup.
+
+__all__ = [
+    'FORWARDED_COMMANDS',
+    'SOCKET_NAME',
+    'main',
+]
+
+SOCKET_NAME = 'daemon.sock'
+# Commands that never prompt, so they can run inside the daemon.
+FORWARDED_COMMANDS = frozenset([
+    'changes',
+    'drain',
+    'notifications',
+    'owed',
+    'payments',
+    'search',
+])
+GLOBAL_OPTIONS = frozenset([
+    '--config-dir',
+    '--record',
+    '--replay',
+    '--replay-latency',
+])
+DEFAULT_CONFIG_DIR = '.venmo-config'
+
+
+def _parse(argv: List[str]):
+  # Returns the global options and the command name, or None for the command
+  # if it isn't one we can forward.
+  options, i = {}, 0
+  while i < len(argv):
+    arg = argv[i]
+    if not arg.startswith('-'):
+      break
+    name, eq, value = arg.partition('=')
+    if name not in GLOBAL_OPTIONS:
+      return options, None
+    if not eq:
+      i += 1
+      if i == len(argv):
+        return options, None
+      value = argv[i]
+    options[name] = value
+    i += 1
+  command = argv[i] if i < len(argv) else None
+  if command not in FORWARDED_COMMANDS or '--help' in argv[i:]:
+    return options, None
+  return options, command
+
+
+def _terminal_width() -> Optional[int]:
+  try:
+    return os.get_terminal_size(sys.stdout.fileno()).columns
+  except (OSError, ValueError):
+    return None
+
+
+def forward(argv: List[str]) -> Optional[int]:
+  # Runs the command in the daemon and returns its exit code, or None if
+  # there's no daemon to run it.
+  options, command = _parse(argv)
+  if command is None or '--record' in options or '--replay' in options:
+    return None
+  config_dir = options.get('--config-dir', DEFAULT_CONFIG_DIR)
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(os.path.join(config_dir, SOCKET_NAME))
+  except OSError:
+    sock.close()
+    return None
+  with sock, sock.makefile('rb') as fp:
+    request = dict(argv=argv, width=_terminal_width(),
+        terminal=sys.stdout.isatty())
+    sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+    for line in fp:
+      message = json.loads(line)
+      if 'exit' in message:
+        sys.stdout.flush()
+        return message['exit']
+      sys.stdout.write(message['out'])
+      sys.stdout.flush()
+  sys.stdout.write('Lost connection to venmo daemon\n')
+  return 1
+
+
+def main():
+  code = forward(sys.argv[1:])
+  if code is not None:
+    sys.exit(code)
+  from venmo_client import cli
+  cli.cli()
@@ -0,0 +1,145 @@
+import dataclasses
+import datetime
+import json
+import os
+import pathlib
+
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from venmo_client import changes
+from venmo_client import model
+from venmo_client import util
+
+__all__ = [
+    'AGE_BUCKETS',
+    'Balance',
+    'Ledger',
+    'age_bucket',
+]
+
+AGE_BUCKETS = (
+    (30, '0-30 days'),
+    (60, '31-60 days'),
+    (90, '61-90 days'),
+    (None, '90+ days'),
+)
+
+
+def age_bucket(days: int) -> str:
+  for limit, name in AGE_BUCKETS:
+    if limit is None or days <= limit:
+      return name
+
+
+@dataclasses.dataclass(frozen=True)
+class Balance:
+  username: str
+  display_name: str
+  amount_cents: int
+  charges: int
+  oldest: datetime.datetime
+  last_reminded: Optional[datetime.datetime]
+  buckets: Dict[str, int]
+
+  @property
+  def age_days(self) -> int:
+    return (datetime.datetime.now(self.oldest.tzinfo) - self.oldest).days
+
+
+class Ledger:
+  # Open charges between the user and each counterparty, persisted as JSON in
+  # the config directory. Positive amounts are owed to the user, negative ones
+  # are owed by the user. Entries are only ever touched for payments that
+  # change, so reading balances never rescans history: syncing applies what a
+  # `ChangeFeed` reports, and the feed's fingerprints are saved in the same
+  # file so the two never disagree. The file records whose ledger it is, and a
+  # ledger left by another account is discarded.
+
+  def __init__(self, path: Union[str, pathlib.Path], user_id: str):
+    self.path = pathlib.Path(path)
+    self.user_id = user_id
+    self.entries: Dict[str, Dict[str, Any]] = {}
+    self.last_synced: Optional[str] = None
+    self.feed = changes.ChangeFeed(None, user_id, action='charge')
+    if self.path.exists():
+      with self.path.open('r') as fp:
+        data = json.load(fp)
+      # Entries saved without the feed's fingerprints can't be kept in step.
+      if data.get('user_id') == user_id and 'feed' in data:
+        self.entries = data['entries']
+        self.last_synced = data.get('last_synced')
+        self.feed.restore(data['feed'])
+
+  def save(self):
+    tmp = self.path.with_name(self.path.name + '.tmp')
+    with tmp.open('w') as fp:
+      json.dump(dict(user_id=self.user_id, entries=self.entries,
+          last_synced=self.last_synced, feed=self.feed.state()), fp)
+    os.replace(tmp, self.path)
+
+  def _entry(self, payment: model.Payment) -> Optional[Dict[str, Any]]:
+    if payment.action != 'charge' or payment.target.user is None:
+      return None
+    if payment.actor.id == self.user_id:
+      sign, counterparty = 1, payment.target.user
+    elif payment.target.user.id == self.user_id:
+      sign, counterparty = -1, payment.actor
+    else:
+      return None
+    return dict(
+        username=counterparty.username,
+        display_name=counterparty.display_name,
+        amount_cents=sign * util.to_cents(payment.amount),
+        note=payment.note,
+        status=payment.status,
+        date_created=payment.date_created.isoformat(),
+        date_reminded=(payment.date_reminded and
+          payment.date_reminded.isoformat()))
+
+  def apply(self, payment: model.Payment) -> bool:
+    entry = None
+    if payment.status in changes.OPEN_STATUSES:
+      entry = self._entry(payment)
+    if entry is None:
+      return self.entries.pop(payment.id, None) is not None
+    changed = self.entries.get(payment.id) != entry
+    self.entries[payment.id] = entry
+    return changed
+
+  def update(self, payments: Iterable[model.Payment]) -> int:
+    return sum(self.apply(payment) for payment in payments)
+
+  def sync(self, client) -> int:
+    # The feed reports every open charge that is new or changed, and every one
+    # that has since been settled or cancelled.
+    changed = self.update(change.payment for change in self.feed.poll(client))
+    self.last_synced = datetime.datetime.now().isoformat()
+    self.save()
+    return changed
+
+  def balances(self, owed_to_me: bool = True) -> List[Balance]:
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in self.entries.values():
+      if (entry['amount_cents'] > 0) == owed_to_me:
+        grouped.setdefault(entry['username'], []).append(entry)
+    balances = []
+    for username, entries in grouped.items():
+      dates = [datetime.datetime.fromisoformat(entry['date_created'])
+          for entry in entries]
+      reminded = [datetime.datetime.fromisoformat(entry['date_reminded'])
+          for entry in entries if entry['date_reminded']]
+      buckets: Dict[str, int] = {}
+      for date, entry in zip(dates, entries):
+        days = (datetime.datetime.now(date.tzinfo) - date).days
+        bucket = age_bucket(days)
+        buckets[bucket] = buckets.get(bucket, 0) + entry['amount_cents']
+      balances.append(Balance(
+          username=username,
+          display_name=entries[0]['display_name'],
+          amount_cents=sum(entry['amount_cents'] for entry in entries),
+          charges=len(entries),
+          oldest=min(dates),
+          last_reminded=max(reminded) if reminded else None,
+          buckets=buckets))
+    balances.sort(key=lambda balance: balance.oldest)
+    return balances
@@ -143,7 +143,8 @@ class Payment:
         id=self.id,
         date_authorized=(self.date_authorized and
           self.date_authorized.isoformat()),
-        date_completed=self.date_completed.isoformat(),
+        date_completed=(self.date_completed and
+          self.date_completed.isoformat()),
         target=self.target.serialize(),
         audience=self.audience,
         actor=self.actor.serialize(),
@@ -435,6 +436,15 @@ class Notification:
     return cls(type, id, message, date_updated=date_updated,
         date_created=date_created, **notification_kwargs)
 
+  def serialize(self):
+    return dict(
+        type=self.type,
+        id=self.id,
+        message=self.message,
+        date_updated=self.date_updated and self.date_updated.isoformat(),
+        date_created=self.date_created and self.date_created.isoformat(),
+        payment=self.payment and self.payment.serialize())
+
   def __repr__(self):
     return (f'Notification(type={self.type}, '
             f'id={self.id}, date_created={self.date_created},'
@@ -0,0 +1,305 @@
+import dataclasses
+import datetime
+import json
+import pathlib
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from typing import Any, Dict, List, Optional, Union
+
+import requests
+
+from venmo_client import util
+
+__all__ = [
+    'Operation',
+    'Outbox',
+]
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS operations (
+  key TEXT PRIMARY KEY,
+  kind TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  state TEXT NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  next_attempt REAL NOT NULL DEFAULT 0,
+  created_at REAL NOT NULL,
+  updated_at REAL NOT NULL,
+  payment_id TEXT,
+  error TEXT,
+  claimed_by TEXT,
+  claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS operations_ready
+  ON operations (state, next_attempt);
+'''
+
+# `queued` and `unknown` operations are ready to be claimed. An `unknown`
+# operation may or may not have reached Venmo (it was in flight during a
+# crash or a network error) and is checked against the account before it is
+# ever sent again. A `sending` operation is leased to the worker that claimed
+# it; once the lease runs out that worker is presumed dead and the operation
+# becomes `unknown`.
+READY_STATES = ('queued', 'unknown')
+FINAL_STATES = ('done', 'failed')
+
+
+@dataclasses.dataclass(frozen=True)
+class Operation:
+  key: str
+  kind: str
+  payload: Dict[str, Any]
+  state: str
+  attempts: int
+  created_at: float
+  payment_id: Optional[str]
+  error: Optional[str]
+  claimed_by: Optional[str]
+
+  @classmethod
+  def new(cls, row: sqlite3.Row) -> 'Operation':
+    return cls(row['key'], row['kind'], json.loads(row['payload']),
+        row['state'], row['attempts'], row['created_at'], row['payment_id'],
+        row['error'], row['claimed_by'])
+
+
+class _Retry(Exception):
+  pass
+
+
+class Outbox:
+  # A crash-safe queue of outbound charges and settles in SQLite. Every
+  # operation carries a client-generated key, so enqueueing the same key twice
+  # is a no-op unless the first attempt failed, and an operation whose outcome
+  # is unknown is only re-sent after the account shows it did not go through.
+  # Several processes can drain the same outbox; `lease` has to outlast the
+  # longest a single send can take.
+
+  def __init__(self,
+      path: Union[str, pathlib.Path],
+      client,
+      max_attempts: int = 5,
+      backoff: float = 1.,
+      lease: float = 600.):
+    self.path = pathlib.Path(path)
+    self.client = client
+    self.max_attempts = max_attempts
+    self.backoff = backoff
+    self.lease = lease
+    self._local = threading.local()
+    self._verify_lock = threading.Lock()
+    with self._connect() as db:
+      db.execute('PRAGMA journal_mode=WAL')
+      db.executescript(SCHEMA)
+      columns = {row['name'] for row in
+          db.execute('PRAGMA table_info(operations)')}
+      for column, kind in (('claimed_by', 'TEXT'), ('claimed_at', 'REAL')):
+        if column not in columns:
+          db.execute(f'ALTER TABLE operations ADD COLUMN {column} {kind}')
+
+  def _connect(self) -> sqlite3.Connection:
+    db = getattr(self._local, 'db', None)
+    if db is None:
+      db = sqlite3.connect(str(self.path), timeout=30)
+      db.row_factory = sqlite3.Row
+      self._local.db = db
+    return db
+
+  def _enqueue(self, kind: str, payload: Dict[str, Any],
+      key: Optional[str]) -> str:
+    key = key or uuid.uuid4().hex
+    now = time.time()
+    with self._connect() as db:
+      db.execute(
+          'INSERT INTO operations '
+          '(key, kind, payload, state, created_at, updated_at) '
+          "VALUES (?, ?, ?, 'queued', ?, ?) "
+          # Only a failed operation can be retried by enqueueing its key again.
+          "ON CONFLICT (key) DO UPDATE SET state = 'unknown', attempts = 0, "
+          "next_attempt = 0, error = NULL WHERE state = 'failed'",
+          (key, kind, json.dumps(payload), now, now))
+    return key
+
+  def charge(self, username: str, amount: float, note: str,
+      key: Optional[str] = None) -> str:
+    return self._enqueue('charge',
+        dict(username=username, amount=amount, note=note), key)
+
+  def unfinished_charges(self, username: str, amount: float,
+      note: str) -> List[Operation]:
+    # Charges of the same person, amount and note that are neither done nor
+    # failed, e.g. left behind by a run that crashed mid-drain. Enqueueing
+    # the charge again under a new key would send it without verifying.
+    payload = dict(username=username, amount=amount, note=note)
+    rows = self._connect().execute(
+        "SELECT * FROM operations WHERE kind = 'charge' "
+        'AND state NOT IN (?, ?) ORDER BY created_at', FINAL_STATES)
+    return [op for op in map(Operation.new, rows) if op.payload == payload]
+
+  def settle(self, payment_id: str, key: Optional[str] = None) -> str:
+    return self._enqueue('settle', dict(payment_id=payment_id), key)
+
+  def get(self, key: str) -> Optional[Operation]:
+    row = self._connect().execute(
+        'SELECT * FROM operations WHERE key = ?', (key,)).fetchone()
+    return row and Operation.new(row)
+
+  def operations(self, state: Optional[str] = None) -> List[Operation]:
+    query, args = 'SELECT * FROM operations', ()
+    if state is not None:
+      query, args = query + ' WHERE state = ?', (state,)
+    rows = self._connect().execute(query + ' ORDER BY created_at', args)
+    return [Operation.new(row) for row in rows]
+
+  def _claim(self) -> Optional[Operation]:
+    db = self._connect()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+      now = time.time()
+      # Operations whose worker let the lease run out were interrupted, by a
+      # crash or otherwise, and may or may not have been sent.
+      db.execute(
+          "UPDATE operations SET state = 'unknown', claimed_by = NULL, "
+          "claimed_at = NULL, updated_at = ? "
+          "WHERE state = 'sending' AND claimed_at < ?", (now, now - self.lease))
+      row = db.execute(
+          'SELECT * FROM operations WHERE state IN (?, ?) '
+          'AND next_attempt <= ? ORDER BY created_at LIMIT 1',
+          (*READY_STATES, now)).fetchone()
+      if row is None:
+        db.execute('COMMIT')
+        return None
+      claim = uuid.uuid4().hex
+      # Keep `unknown` in the claimed row so the worker verifies first.
+      db.execute(
+          "UPDATE operations SET state = 'sending', attempts = attempts + 1, "
+          'claimed_by = ?, claimed_at = ?, updated_at = ? WHERE key = ?',
+          (claim, now, now, row['key']))
+      db.execute('COMMIT')
+    except BaseException:
+      db.execute('ROLLBACK')
+      raise
+    return dataclasses.replace(Operation.new(row), claimed_by=claim)
+
+  def _finish(self, op: Operation, state: str, *,
+      payment_id: Optional[str] = None, error: Optional[str] = None,
+      next_attempt: float = 0.):
+    # Only while we still hold the claim; once the lease has been taken over
+    # the outcome belongs to the new worker.
+    with self._connect() as db:
+      db.execute(
+          'UPDATE operations SET state = ?, payment_id = ?, error = ?, '
+          'next_attempt = ?, updated_at = ?, claimed_by = NULL, '
+          'claimed_at = NULL WHERE key = ? AND claimed_by = ?',
+          (state, payment_id, error, next_attempt, time.time(), op.key,
+              op.claimed_by))
+
+  def _claimed_payment_ids(self) -> set:
+    rows = self._connect().execute(
+        'SELECT payment_id FROM operations WHERE payment_id IS NOT NULL')
+    return {row['payment_id'] for row in rows}
+
+  def _verify(self, op: Operation) -> Optional[str]:
+    # Returns the id of the payment this operation already produced, if any.
+    if op.kind == 'settle':
+      payment = self.client.get_payment(op.payload['payment_id'])
+      return payment.id if payment.status == 'settled' else None
+    claimed = self._claimed_payment_ids()
+    amount = util.to_cents(op.payload['amount'])
+    created_at = datetime.datetime.fromtimestamp(op.created_at,
+        datetime.timezone.utc)
+    for payment in self.client.payments(action='charge', limit=200):
+      date_created = payment.date_created
+      if date_created.tzinfo is None:
+        date_created = date_created.replace(tzinfo=datetime.timezone.utc)
+      if date_created < created_at - datetime.timedelta(minutes=5):
+        break
+      if (payment.id not in claimed
+          and payment.actor.id == self.client.user_id
+          and payment.target.user is not None
+          and payment.target.user.username == op.payload['username']
+          and util.to_cents(payment.amount) == amount
+          and payment.note == op.payload['note']):
+        return payment.id
+    return None
+
+  def _send(self, op: Operation) -> Optional[str]:
+    try:
+      if op.kind == 'charge':
+        result = self.client.request(op.payload['note'],
+            op.payload['username'], op.payload['amount'])
+      else:
+        result = self.client.settle(op.payload['payment_id'])
+    except requests.RequestException as e:
+      # The request may or may not have been applied.
+      raise _Retry(repr(e)) from e
+    except ValueError as e:
+      status = e.args[0] if e.args else None
+      if not isinstance(status, int):
+        # The response couldn't be decoded, so it may have been applied.
+        raise _Retry(repr(e)) from e
+      if status >= 500 or status == 429:
+        raise _Retry(f'HTTP {status}') from e
+      raise
+    data = (result or {}).get('data') or {}
+    payment = data.get('payment', data)
+    return payment.get('id') or op.payload.get('payment_id')
+
+  def _retry(self, op: Operation, error: str):
+    if op.attempts + 1 >= self.max_attempts:
+      self._finish(op, 'failed', error=error)
+      return
+    delay = self.backoff * 2 ** op.attempts * (1 + random.random())
+    self._finish(op, 'unknown', error=error, next_attempt=time.time() + delay)
+
+  def process(self, op: Operation):
+    try:
+      if op.state == 'unknown':
+        # Serialized so two identical charges can't claim the same payment.
+        with self._verify_lock:
+          payment_id = self._verify(op)
+          if payment_id is not None:
+            self._finish(op, 'done', payment_id=payment_id)
+            return
+      payment_id = self._send(op)
+    except _Retry as e:
+      self._retry(op, str(e))
+      return
+    except requests.RequestException as e:
+      # Verification itself failed; try again later without sending.
+      self._retry(op, repr(e))
+      return
+    except Exception as e:
+      self._finish(op, 'failed', error=repr(e))
+      return
+    self._finish(op, 'done', payment_id=payment_id)
+
+  def _next_ready(self) -> Optional[float]:
+    row = self._connect().execute(
+        'SELECT MIN(next_attempt) FROM operations WHERE state IN (?, ?)',
+        READY_STATES).fetchone()
+    return row[0]
+
+  def _work(self):
+    while True:
+      op = self._claim()
+      if op is not None:
+        self.process(op)
+        continue
+      next_attempt = self._next_ready()
+      if next_attempt is None:
+        return
+      time.sleep(min(max(next_attempt - time.time(), 0.05), 5.))
+
+  def drain(self, workers: int = 4) -> List[Operation]:
+    threads = [threading.Thread(target=self._work, daemon=True)
+        for _ in range(workers)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    return self.operations()
@@ -0,0 +1,90 @@
+import threading
+
+from typing import Dict, Optional, Tuple
+
+__all__ = [
+    'PAGE_SIZE_BOUNDS',
+    'PageSizer',
+]
+
+# (initial, minimum, maximum) page size per paginated endpoint. The maximum
+# is only an upper bound to probe towards; once the server refuses a size it
+# is lowered to below that size.
+PAGE_SIZE_BOUNDS: Dict[str, Tuple[int, int, int]] = {
+    'stories': (50, 10, 200),
+    'payments': (50, 10, 200),
+    'notifications': (50, 10, 200),
+}
+
+
+class PageSizer:
+  # Hill-climbs the page size on per-item latency: keep growing while each
+  # larger page is cheaper per item, settle on the best size once it stops
+  # paying off, and halve on timeouts or server errors. After
+  # `probe_interval` settled pages it starts probing upwards again.
+
+  def __init__(self,
+      initial: int = 50,
+      minimum: int = 10,
+      maximum: int = 200,
+      growth: float = 1.5,
+      tolerance: float = 0.05,
+      probe_interval: int = 20):
+    self.size = initial
+    self.minimum = minimum
+    self.maximum = maximum
+    self.growth = growth
+    self.tolerance = tolerance
+    self.probe_interval = probe_interval
+    self.settled_pages = 0
+    self.growing = True
+    self.best: Optional[Tuple[int, float]] = None
+    self.pages = 0
+    self.failures = 0
+    self._lock = threading.Lock()
+
+  def _clamp(self, size: int) -> int:
+    return max(self.minimum, min(self.maximum, size))
+
+  def observe(self, items: int, elapsed: float):
+    with self._lock:
+      self._observe(items, elapsed)
+
+  def _observe(self, items: int, elapsed: float):
+    self.pages += 1
+    # A short page is the end of the listing and says nothing about latency.
+    if items < self.size:
+      return
+    per_item = elapsed / items
+    if not self.growing:
+      self.settled_pages += 1
+      if self.settled_pages >= self.probe_interval:
+        self.growing, self.best, self.settled_pages = True, None, 0
+    if self.best is None or per_item < self.best[1] * (1 - self.tolerance):
+      self.best = (self.size, per_item)
+      if self.growing:
+        self.size = self._clamp(int(self.size * self.growth))
+    else:
+      self.growing = False
+      self.size = self.best[0]
+
+  def failure(self):
+    with self._lock:
+      self._failure()
+
+  def _failure(self):
+    self.failures += 1
+    self.growing = False
+    self.settled_pages = 0
+    self.best = None
+    self.size = self._clamp(self.size // 2)
+
+  def reject(self, size: int):
+    # The server refused `size` as a page size; never ask for it again.
+    with self._lock:
+      self.maximum = max(self.minimum, min(self.maximum, size - 1))
+      self.size = self._clamp(self.size)
+
+  def stats(self) -> Dict[str, int]:
+    return dict(size=self.size, maximum=self.maximum, pages=self.pages,
+        failures=self.failures)
@@ -0,0 +1,201 @@
+import collections
+import cProfile
+import io
+import os
+import pathlib
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from typing import Dict, List, Optional, Tuple, Union
+
+__all__ = [
+    'SUBSYSTEMS',
+    'Profiler',
+    'subsystem',
+]
+
+# Checked in order against a frame's file path; anything else is `other`.
+# Time and allocations are charged to the innermost frame on the stack that
+# belongs to a subsystem, so C functions and generated code such as dataclass
+# `__init__` count towards whatever called them.
+SUBSYSTEMS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ('render', ('/rich/', '/click/', '/venmo_client/console.py')),
+    ('decode', ('/json/', '_json', 'orjson', 'msgspec',
+        '/venmo_client/model/', '/venmo_client/codec.py',
+        '/venmo_client/decode.py')),
+    ('transport', ('/requests/', '/urllib3/', '/http/', '/ssl.py', '_ssl',
+        '/socket.py', '_socket', '/selectors.py',
+        '/venmo_client/cassette.py')),
+)
+OTHER = 'other'
+# Frames kept per allocation traceback. Library and generated frames are
+# rarely more than a few deep before a caller that decides their subsystem,
+# and every extra frame slows down the profiled code.
+TRACEBACK_FRAMES = 4
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)).replace(
+    os.sep, '/') + '/'
+
+
+def subsystem(filename: str) -> str:
+  filename = filename.replace(os.sep, '/')
+  for name, patterns in SUBSYSTEMS:
+    if any(pattern in filename for pattern in patterns):
+      return name
+  return OTHER
+
+
+def _innermost(filenames) -> str:
+  # `filenames` runs from the innermost frame outwards. Frames from the
+  # standard library, other packages and generated code defer to their
+  # caller; the first frame in a subsystem or in this package decides.
+  for filename in filenames:
+    name = subsystem(filename)
+    if name != OTHER or filename.replace(os.sep, '/').startswith(PACKAGE_DIR):
+      return name
+  return OTHER
+
+
+def _frames(frame):
+  while frame is not None:
+    yield frame
+    frame = frame.f_back
+
+
+def _label(code) -> str:
+  return f'{code.co_name} ({os.path.basename(code.co_filename)})'
+
+
+class Profiler:
+  # Profiles everything between `start` and `stop` three ways: cProfile for
+  # exact per-function time on the calling thread, tracemalloc for
+  # allocations, and a sampling thread that records every thread's stack for
+  # a flamegraph. Time per subsystem comes from the calling thread's samples.
+  # `save` writes `<path>.txt` (the report), `<path>.folded` (collapsed
+  # stacks for flamegraph.pl or speedscope) and `<path>.pstats`.
+
+  def __init__(self, path: Union[str, pathlib.Path], interval: float = 0.005):
+    self.path = pathlib.Path(path)
+    self.interval = interval
+    self.stacks: Dict[str, int] = collections.Counter()
+    self.samples: Dict[str, int] = collections.Counter()
+    self.elapsed = 0.
+    self._profile = cProfile.Profile()
+    self._stop = threading.Event()
+    self._sampler: Optional[threading.Thread] = None
+    self._snapshot: Optional[tracemalloc.Snapshot] = None
+    self._start = 0.
+    self._thread: Optional[int] = None
+
+  def _sample(self):
+    me = threading.get_ident()
+    names = {}
+    while not self._stop.wait(self.interval):
+      for thread in threading.enumerate():
+        names[thread.ident] = thread.name
+      for ident, frame in sys._current_frames().items():
+        if ident == me:
+          continue
+        frames = list(_frames(frame))
+        if ident == self._thread:
+          self.samples[_innermost(
+              caller.f_code.co_filename for caller in frames)] += 1
+        stack = [_label(frame.f_code) for frame in frames]
+        stack.append(names.get(ident, str(ident)))
+        self.stacks[';'.join(reversed(stack))] += 1
+
+  def start(self):
+    self._thread = threading.get_ident()
+    tracemalloc.start(TRACEBACK_FRAMES)
+    self._sampler = threading.Thread(target=self._sample, daemon=True)
+    self._sampler.start()
+    self._start = time.perf_counter()
+    self._profile.enable()
+
+  def stop(self):
+    self._profile.disable()
+    self.elapsed = time.perf_counter() - self._start
+    self._snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    self._stop.set()
+    self._sampler.join()
+
+  def __enter__(self) -> 'Profiler':
+    self.start()
+    return self
+
+  def __exit__(self, *exc):
+    self.stop()
+
+  def _times(self) -> Dict[str, float]:
+    # Wall time per subsystem, estimated from the share of samples.
+    total = sum(self.samples.values())
+    if not total:
+      return {}
+    return {name: self.elapsed * count / total
+        for name, count in self.samples.items()}
+
+  def _functions(self) -> List[Tuple[float, float, str]]:
+    # Cumulative and self time of every function, most cumulative first.
+    stats = pstats.Stats(self._profile)
+    functions = []
+    for (filename, line, name), (_, _, tottime, cumtime, _) in (
+        stats.stats.items()):
+      functions.append((cumtime, tottime,
+          f'{name} ({os.path.basename(filename)}:{line})'))
+    functions.sort(reverse=True)
+    return functions
+
+  def _allocations(self) -> Dict[str, Tuple[int, int]]:
+    # Bytes and blocks still allocated at `stop`, by the innermost subsystem
+    # on the stack that allocated them.
+    allocations: Dict[str, List[int]] = collections.defaultdict(
+        lambda: [0, 0])
+    trace_filter = tracemalloc.Filter(False, tracemalloc.__file__)
+    snapshot = self._snapshot.filter_traces([trace_filter])
+    for stat in snapshot.statistics('traceback'):
+      # Tracebacks run from the outermost frame in.
+      totals = allocations[_innermost(
+          caller.filename for caller in reversed(stat.traceback))]
+      totals[0] += stat.size
+      totals[1] += stat.count
+    return {name: tuple(totals) for name, totals in allocations.items()}
+
+  def report(self, top: int = 20) -> str:
+    times, functions = self._times(), self._functions()
+    allocations = self._allocations()
+    samples = collections.Counter()
+    for stack, count in self.stacks.items():
+      leaf = stack.rsplit(';', 1)[-1]
+      samples[leaf] += count
+    out = io.StringIO()
+    out.write(f'Wall time: {self.elapsed:.3f}s\n\n')
+    out.write(f'{"Subsystem":<10} {"Time":>10} {"%":>6} '
+        f'{"Allocated":>12} {"Blocks":>8}\n')
+    total = sum(times.values()) or 1.
+    for name in [name for name, _ in SUBSYSTEMS] + [OTHER]:
+      size, count = allocations.get(name, (0, 0))
+      out.write(f'{name:<10} {times.get(name, 0.):>9.3f}s '
+          f'{100 * times.get(name, 0.) / total:>5.1f}% '
+          f'{size / 1024:>10.1f}KB {count:>8}\n')
+    out.write(f'\nTop {top} functions by cumulative time:\n')
+    for cumtime, tottime, name in functions[:top]:
+      out.write(f'{cumtime:>9.3f}s {tottime:>9.3f}s  {name}\n')
+    out.write(f'\nTop {top} sampled frames (every {self.interval * 1e3:g}ms, '
+        'all threads):\n')
+    for leaf, count in samples.most_common(top):
+      out.write(f'{count:>9}  {leaf}\n')
+    return out.getvalue()
+
+  def save(self) -> str:
+    report = self.report()
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    with open(f'{self.path}.txt', 'w') as fp:
+      fp.write(report)
+    with open(f'{self.path}.folded', 'w') as fp:
+      for stack, count in sorted(self.stacks.items()):
+        fp.write(f'{stack} {count}\n')
+    self._profile.dump_stats(f'{self.path}.pstats')
+    return report
@@ -0,0 +1,192 @@
+import array
+import dataclasses
+import datetime
+import itertools
+
+from typing import Iterable, List, Literal, Optional, Tuple, Union
+
+from venmo_client import model
+from venmo_client import util
+
+__all__ = [
+    'Discrepancy',
+    'Reconciliation',
+    'reconcile',
+    'signed_cents',
+]
+
+Amount = Union[str, int, float]
+
+DiscrepancyKind = Literal[
+    'duplicate',
+    'gap',
+    'mismatch',
+]
+
+# Payments funded from anything other than the Venmo balance never touch it.
+BALANCE_FUNDING_TYPES = ('balance',)
+FAILED_TRANSFER_STATUSES = ('failed', 'cancelled', 'canceled', 'reversed')
+
+
+@dataclasses.dataclass(frozen=True)
+class Discrepancy:
+  kind: DiscrepancyKind
+  message: str
+  transaction_id: Optional[str] = None
+  expected_cents: Optional[int] = None
+  actual_cents: Optional[int] = None
+
+
+def _payment_cents(txn: model.Transaction, user_id: str) -> int:
+  payment = txn.payment
+  if payment.status != 'settled':
+    return 0
+  target = payment.target
+  target_id = (target.user.id if target.user is not None
+      else target.merchant.id)
+  if payment.action == 'pay':
+    payer_id, payee_id = payment.actor.id, target_id
+  else:
+    payer_id, payee_id = target_id, payment.actor.id
+  amount = util.to_cents(payment.amount)
+  if payee_id == user_id:
+    return amount
+  if payer_id == user_id:
+    funding_source = txn.funding_source
+    if (funding_source is not None
+        and funding_source.type not in BALANCE_FUNDING_TYPES):
+      return 0
+    return -amount
+  return 0
+
+
+def _transfer_cents(txn: model.Transaction) -> int:
+  transfer = txn.transfer
+  if transfer.status in FAILED_TRANSFER_STATUSES:
+    return 0
+  if transfer.type == 'add_funds':
+    return transfer.amount_cents
+  return -(transfer.amount_cents + transfer.amount_fee_cents)
+
+
+def _capture_cents(txn: model.Transaction) -> int:
+  capture = txn.capture
+  top_up = (capture.top_up or {}).get('amount_cents', 0)
+  return top_up - capture.amount_cents
+
+
+def signed_cents(txn: model.Transaction, user_id: str) -> int:
+  if txn.type == 'payment':
+    return _payment_cents(txn, user_id)
+  if txn.type == 'transfer':
+    return _transfer_cents(txn)
+  if txn.type == 'capture':
+    return _capture_cents(txn)
+  # Authorizations are holds; the matching capture moves the money.
+  return 0
+
+
+class Reconciliation:
+
+  def __init__(self, user_id: str, start_balance: Amount = 0):
+    self.user_id = user_id
+    self.start_cents = util.to_cents(start_balance)
+    self.ids: List[str] = []
+    self.dates: List[datetime.datetime] = []
+    self.deltas = array.array('q')
+    self.balances = array.array('q')
+    self.discrepancies: List[Discrepancy] = []
+    # First and last date covered by the batches so far.
+    self.covered: Optional[Tuple[datetime.date, datetime.date]] = None
+    self._seen = set()
+
+  @property
+  def balance_cents(self) -> int:
+    return self.balances[-1] if self.balances else self.start_cents
+
+  def _check_continues(self, start: Optional[datetime.date],
+      start_balance: Optional[Amount]) -> List[Discrepancy]:
+    found = []
+    if self.covered is None:
+      return found
+    last = self.covered[1]
+    if start is not None and start > last + datetime.timedelta(days=1):
+      found.append(Discrepancy('gap',
+        f'Nothing covers {last + datetime.timedelta(days=1)} to '
+        f'{start - datetime.timedelta(days=1)}'))
+    if (start_balance is not None
+        and util.to_cents(start_balance) != self.balance_cents):
+      expected = util.to_cents(start_balance)
+      found.append(Discrepancy('gap',
+        f'Batch starting {start or "later"} opens at {expected / 100:.2f} but '
+        f'the running balance is {self.balance_cents / 100:.2f}',
+        expected_cents=expected, actual_cents=self.balance_cents))
+    return found
+
+  def extend(self,
+      transactions: Iterable[model.Transaction],
+      *,
+      start: Optional[Union[str, datetime.date]] = None,
+      end: Optional[Union[str, datetime.date]] = None,
+      start_balance: Optional[Amount] = None) -> List[Discrepancy]:
+    # `start` and `end` are the dates the batch covers, e.g. a statement
+    # window, and `start_balance` its opening balance. With them, a batch that
+    # doesn't pick up where the previous one left off is flagged as a gap.
+    start = util.canonicalize_date(start) if start is not None else None
+    end = util.canonicalize_date(end) if end is not None else None
+    found = self._check_continues(start, start_balance)
+    batch = []
+    for txn in transactions:
+      if txn.id in self._seen:
+        found.append(Discrepancy('duplicate',
+          f'Transaction {txn.id} seen more than once', transaction_id=txn.id))
+        continue
+      self._seen.add(txn.id)
+      batch.append(txn)
+    batch.sort(key=lambda txn: txn.datetime_created)
+    if batch and self.dates and batch[0].datetime_created < self.dates[-1]:
+      found.append(Discrepancy('gap',
+        f'Transaction {batch[0].id} at {batch[0].datetime_created} predates '
+        f'the last reconciled transaction at {self.dates[-1]}',
+        transaction_id=batch[0].id))
+    deltas = array.array('q', [signed_cents(txn, self.user_id)
+      for txn in batch])
+    balances = itertools.accumulate(deltas, initial=self.balance_cents)
+    next(balances)
+    self.balances.extend(balances)
+    self.deltas.extend(deltas)
+    self.ids.extend(txn.id for txn in batch)
+    self.dates.extend(txn.datetime_created for txn in batch)
+    first = start or (batch[0].datetime_created.date() if batch else None)
+    last = end or (batch[-1].datetime_created.date() if batch else None)
+    if first is not None and last is not None:
+      if self.covered is not None:
+        first = min(first, self.covered[0])
+        last = max(last, self.covered[1])
+      self.covered = (first, last)
+    self.discrepancies.extend(found)
+    return found
+
+  def check(self, end_balance: Amount) -> Optional[Discrepancy]:
+    expected = util.to_cents(end_balance)
+    if expected == self.balance_cents:
+      return None
+    discrepancy = Discrepancy('mismatch',
+        f'Running balance {self.balance_cents / 100:.2f} does not match '
+        f'statement balance {expected / 100:.2f}',
+        expected_cents=expected, actual_cents=self.balance_cents)
+    self.discrepancies.append(discrepancy)
+    return discrepancy
+
+  def is_balanced(self) -> bool:
+    return not self.discrepancies
+
+
+def reconcile(transactions: Iterable[model.Transaction], user_id: str,
+    start_balance: Amount, end_balance: Amount, *,
+    start: Optional[Union[str, datetime.date]] = None,
+    end: Optional[Union[str, datetime.date]] = None) -> Reconciliation:
+  reconciliation = Reconciliation(user_id, start_balance)
+  reconciliation.extend(transactions, start=start, end=end)
+  reconciliation.check(end_balance)
+  return reconciliation
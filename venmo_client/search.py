@@ -0,0 +1,170 @@
+import datetime
+import pathlib
+import re
+import sqlite3
+import threading
+
+from typing import Any, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from venmo_client import aggregate
+from venmo_client import model
+from venmo_client import util
+
+__all__ = [
+    'Result',
+    'SearchIndex',
+]
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+  rowid INTEGER PRIMARY KEY,
+  id TEXT UNIQUE NOT NULL,
+  kind TEXT NOT NULL,
+  date TEXT NOT NULL,
+  amount_cents INTEGER,
+  counterparty TEXT,
+  note TEXT,
+  names TEXT
+);
+CREATE INDEX IF NOT EXISTS documents_date ON documents (date);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5 (
+  note, names,
+  content='documents', content_rowid='rowid',
+  tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS documents_insert AFTER INSERT ON documents BEGIN
+  INSERT INTO documents_fts (rowid, note, names)
+    VALUES (new.rowid, new.note, new.names);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_delete AFTER DELETE ON documents BEGIN
+  INSERT INTO documents_fts (documents_fts, rowid, note, names)
+    VALUES ('delete', old.rowid, old.note, old.names);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_update AFTER UPDATE ON documents BEGIN
+  INSERT INTO documents_fts (documents_fts, rowid, note, names)
+    VALUES ('delete', old.rowid, old.note, old.names);
+  INSERT INTO documents_fts (rowid, note, names)
+    VALUES (new.rowid, new.note, new.names);
+END;
+'''
+
+# Matches in a note count for more than matches in a name.
+NOTE_WEIGHT, NAMES_WEIGHT = 2., 1.
+
+
+class Result(NamedTuple):
+  id: str
+  kind: str
+  date: datetime.datetime
+  amount_cents: Optional[int]
+  counterparty: Optional[str]
+  note: str
+  rank: float
+
+
+def _parties(item: Any) -> List[Tuple[str, str]]:
+  payment = item if isinstance(item, model.Payment) else item.payment
+  parties = []
+  if payment is not None:
+    parties.append((payment.actor.id, payment.actor.display_name))
+    parties.append((payment.actor.id, payment.actor.username))
+    if payment.target.user is not None:
+      user = payment.target.user
+      parties += [(user.id, user.display_name), (user.id, user.username)]
+    elif payment.target.merchant is not None:
+      merchant = payment.target.merchant
+      parties.append((merchant.id, merchant.display_name))
+  name = aggregate.merchant(item)
+  if name:
+    parties.append((None, name))
+  return parties
+
+
+def _match(query: str) -> str:
+  # Every word has to appear, as a prefix, in either the note or a name.
+  # Quoting each word keeps FTS5 syntax in user input from being parsed.
+  words = re.findall(r'\w+', query)
+  return ' '.join(f'"{word}"*' for word in words)
+
+
+class SearchIndex:
+  # A full-text index over notes and counterparty names in SQLite FTS5.
+  # Documents are keyed by story or payment id, so adding an item again just
+  # replaces it, and callers feed in new items as they are fetched rather
+  # than rebuilding.
+
+  def __init__(self, path: Union[str, pathlib.Path], user_id: str):
+    self.path = pathlib.Path(path)
+    self.user_id = user_id
+    self._local = threading.local()
+    with self._connect() as db:
+      db.execute('PRAGMA journal_mode=WAL')
+      db.executescript(SCHEMA)
+
+  def _connect(self) -> sqlite3.Connection:
+    db = getattr(self._local, 'db', None)
+    if db is None:
+      db = sqlite3.connect(str(self.path), timeout=30)
+      self._local.db = db
+    return db
+
+  def __len__(self) -> int:
+    return self._connect().execute(
+        'SELECT COUNT(*) FROM documents').fetchone()[0]
+
+  def _row(self, item: Any) -> Tuple[Any, ...]:
+    if isinstance(item, model.Payment):
+      kind, date = 'payment', item.date_created
+    else:
+      kind, date = item.type, item.datetime_created
+    names, counterparty = [], None
+    for party_id, name in _parties(item):
+      # Our own name would match every document.
+      if party_id == self.user_id or not name or name in names:
+        continue
+      names.append(name)
+      counterparty = counterparty or name
+    amount = (util.to_cents(item.amount) if item.amount is not None
+        else None)
+    return (item.id, kind, date.isoformat(), amount, counterparty,
+        item.note or '', ' '.join(names))
+
+  def add(self, items: Iterable[Any]) -> int:
+    rows = [self._row(item) for item in items]
+    with self._connect() as db:
+      db.executemany(
+          'INSERT INTO documents '
+          '(id, kind, date, amount_cents, counterparty, note, names) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?) '
+          'ON CONFLICT (id) DO UPDATE SET kind = excluded.kind, '
+          'date = excluded.date, amount_cents = excluded.amount_cents, '
+          'counterparty = excluded.counterparty, note = excluded.note, '
+          'names = excluded.names', rows)
+    return len(rows)
+
+  def search(self, query: str, *,
+      limit: int = 20,
+      start: Optional[Union[str, datetime.date]] = None,
+      end: Optional[Union[str, datetime.date]] = None) -> List[Result]:
+    match = _match(query)
+    if not match:
+      return []
+    sql = ('SELECT d.id, d.kind, d.date, d.amount_cents, d.counterparty, '
+        'd.note, bm25(documents_fts, ?, ?) AS rank '
+        'FROM documents_fts JOIN documents d ON d.rowid = documents_fts.rowid '
+        'WHERE documents_fts MATCH ?')
+    args: List[Any] = [NOTE_WEIGHT, NAMES_WEIGHT, match]
+    if start is not None:
+      sql += ' AND d.date >= ?'
+      args.append(util.canonicalize_date(start).isoformat())
+    if end is not None:
+      # Dates are stored as ISO timestamps, so compare against the next day.
+      sql += ' AND d.date < ?'
+      args.append((util.canonicalize_date(end)
+          + datetime.timedelta(days=1)).isoformat())
+    sql += ' ORDER BY rank, d.date DESC LIMIT ?'
+    args.append(limit)
+    return [Result(id, kind, datetime.datetime.fromisoformat(date), amount,
+        counterparty, note, rank)
+        for id, kind, date, amount, counterparty, note, rank
+        in self._connect().execute(sql, args)]
@@ -0,0 +1,57 @@
+import asyncio
+import concurrent.futures as futures
+import threading
+
+from typing import Any, Callable, Dict, Hashable, Optional
+
+__all__ = [
+    'Group'
+]
+
+
+class Group:
+  # Concurrent calls with the same key share a single execution of `fn`.
+  # Threads block on the shared future, coroutines await it, and every caller
+  # sees the same result or exception.
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._calls: Dict[Hashable, futures.Future] = {}
+    self.hits = 0
+    self.misses = 0
+
+  def _join(self, key: Hashable):
+    with self._lock:
+      future = self._calls.get(key)
+      if future is not None:
+        self.hits += 1
+        return future, False
+      future = self._calls[key] = futures.Future()
+      self.misses += 1
+      return future, True
+
+  def _run(self, key: Hashable, future: futures.Future, fn: Callable[[], Any]):
+    try:
+      future.set_result(fn())
+    except BaseException as e:
+      future.set_exception(e)
+    finally:
+      with self._lock:
+        del self._calls[key]
+
+  def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+    future, leader = self._join(key)
+    if leader:
+      self._run(key, future, fn)
+    return future.result()
+
+  async def do_async(self, key: Hashable, fn: Callable[[], Any],
+      executor: Optional[futures.Executor] = None) -> Any:
+    future, leader = self._join(key)
+    if leader:
+      loop = asyncio.get_running_loop()
+      loop.run_in_executor(executor, self._run, key, future, fn)
+    return await asyncio.wrap_future(future)
+
+  def stats(self) -> Dict[str, int]:
+    return dict(hits=self.hits, misses=self.misses, inflight=len(self._calls))
@@ -0,0 +1,181 @@
+import datetime
+import os
+import pathlib
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from venmo_client import codec
+from venmo_client import model
+from venmo_client import reconcile
+from venmo_client import util
+
+__all__ = [
+    'StatementCache',
+]
+
+Month = datetime.date
+# Fetches the raw `data` of a statement between two dates, inclusive.
+Fetch = Callable[[datetime.date, datetime.date], Dict[str, Any]]
+
+
+def month_start(date: datetime.date) -> Month:
+  return date.replace(day=1)
+
+
+def month_end(month: Month) -> datetime.date:
+  return next_month(month) - datetime.timedelta(days=1)
+
+
+def next_month(month: Month) -> Month:
+  if month.month == 12:
+    return month.replace(year=month.year + 1, month=1)
+  return month.replace(month=month.month + 1)
+
+
+def months_between(start: datetime.date, end: datetime.date) -> List[Month]:
+  months, month = [], month_start(start)
+  while month <= end:
+    months.append(month)
+    month = next_month(month)
+  return months
+
+
+class _Partition:
+
+  def __init__(self, start_cents: int, end_cents: int,
+      transactions: List[Dict[str, Any]]):
+    self.start_cents = start_cents
+    self.end_cents = end_cents
+    self.transactions = transactions
+
+  def serialize(self, user_id: str) -> Dict[str, Any]:
+    return dict(user_id=user_id, start_balance_cents=self.start_cents,
+        end_balance_cents=self.end_cents, transactions=self.transactions)
+
+
+class StatementCache:
+  # Transaction-history statements split by calendar month under
+  # `config_dir/statements`. Months that have ended never change, so each is
+  # fetched once and kept as `YYYY-MM.json`; the current month is always
+  # fetched live, and no range takes more than one request. Any date range is
+  # assembled from whole months, trimmed at both ends, with balances carried
+  # through the trimmed transactions.
+
+  def __init__(self, path: Union[str, pathlib.Path], user_id: str,
+      fetch: Fetch):
+    self.path = pathlib.Path(path)
+    self.path.mkdir(parents=True, exist_ok=True)
+    self.user_id = user_id
+    self.fetch = fetch
+
+  def _file(self, month: Month) -> pathlib.Path:
+    return self.path / f'{month:%Y-%m}.json'
+
+  def _load(self, month: Month) -> Optional[_Partition]:
+    try:
+      with self._file(month).open('rb') as fp:
+        data = codec.loads(fp.read())
+    except FileNotFoundError:
+      return None
+    if data['user_id'] != self.user_id:
+      return None
+    return _Partition(data['start_balance_cents'], data['end_balance_cents'],
+        data['transactions'])
+
+  def _save(self, month: Month, partition: _Partition):
+    path = self._file(month)
+    tmp = path.with_name(path.name + '.tmp')
+    with tmp.open('wb') as fp:
+      fp.write(codec.dumps(partition.serialize(self.user_id)))
+    os.replace(tmp, path)
+
+  def _split(self, months: List[Month], end: datetime.date
+      ) -> Tuple[_Partition, Optional[Dict[Month, _Partition]]]:
+    # One request for all of `months`, as a whole and divided into partitions
+    # by carrying the starting balance forward. The partitions are None if
+    # the carried balance doesn't land on the statement's end balance, since
+    # then the month boundaries can't be trusted. A single month takes its
+    # balances from the statement.
+    data = self.fetch(months[0], end)
+    by_month: Dict[Month, List[Dict[str, Any]]] = {
+        month: [] for month in months}
+    cents: Dict[Month, int] = dict.fromkeys(months, 0)
+    for raw in data['transactions']:
+      txn = model.Transaction.new(**raw)
+      month = month_start(txn.datetime_created.date())
+      if month not in by_month:
+        continue
+      by_month[month].append(raw)
+      cents[month] += reconcile.signed_cents(txn, self.user_id)
+    start, end = (util.to_cents(data['start_balance']),
+        util.to_cents(data['end_balance']))
+    whole = _Partition(start, end,
+        [raw for month in months for raw in by_month[month]])
+    if len(months) == 1:
+      return whole, {months[0]: whole}
+    partitions = {}
+    for month in months:
+      partitions[month] = _Partition(start, start + cents[month],
+          by_month[month])
+      start += cents[month]
+    if start != end:
+      return whole, None
+    return whole, partitions
+
+  def _spans(self, months: List[Month], today: datetime.date
+      ) -> List[_Partition]:
+    # Partitions covering `months` in order. Every month missing from disk is
+    # covered by a single request.
+    current = month_start(today)
+    partitions = {}
+    for month in months:
+      partition = self._load(month) if month < current else None
+      if partition is not None:
+        partitions[month] = partition
+    missing = [month for month in months if month not in partitions]
+    if not missing:
+      return [partitions[month] for month in months]
+    span = months_between(missing[0], missing[-1])
+    whole, fetched = self._split(span, min(month_end(missing[-1]), today))
+    if fetched is None:
+      # The month boundaries can't be trusted, so the statement stands in for
+      # all of its months as one span, and nothing is cached.
+      return ([partitions[month] for month in months if month < span[0]]
+          + [whole]
+          + [partitions[month] for month in months if month > span[-1]])
+    for month in missing:
+      partitions[month] = fetched[month]
+      if month < current:
+        self._save(month, fetched[month])
+    return [partitions[month] for month in months]
+
+  def get(self, start_date: datetime.date, end_date: datetime.date,
+      today: Optional[datetime.date] = None
+      ) -> Tuple[List[model.Transaction], Tuple[float, float]]:
+    today = today or datetime.date.today()
+    end_date = min(end_date, today)
+    if start_date > end_date:
+      raise ValueError(f'Empty date range: {start_date} to {end_date}')
+    spans = self._spans(months_between(start_date, end_date), today)
+    transactions = []
+    start_cents = end_cents = None
+    for partition in spans:
+      if start_cents is None:
+        start_cents = partition.start_cents
+      for raw in partition.transactions:
+        txn = model.Transaction.new(**raw)
+        date = txn.datetime_created.date()
+        if date < start_date:
+          start_cents += reconcile.signed_cents(txn, self.user_id)
+        elif date <= end_date:
+          transactions.append(txn)
+      end_cents = partition.end_cents
+    # Months are assembled in order but each keeps the server's order, which
+    # isn't guaranteed to be oldest first.
+    transactions.sort(key=lambda txn: txn.datetime_created)
+    # Transactions after `end_date` in the last month come back off the end.
+    for raw in spans[-1].transactions:
+      txn = model.Transaction.new(**raw)
+      if txn.datetime_created.date() > end_date:
+        end_cents -= reconcile.signed_cents(txn, self.user_id)
+    return transactions, (start_cents / 100, end_cents / 100)
@@ -0,0 +1,100 @@
+import collections
+import collections.abc
+import datetime
+import heapq
+
+from typing import Any, Hashable, Iterable, Iterator, Set, Tuple, Union
+
+from venmo_client import aggregate
+from venmo_client import model
+
+__all__ = [
+    'event_key',
+    'merge',
+    'richness',
+]
+
+Item = Union[model.Transaction, model.Payment]
+
+
+def _timestamp(item: Item) -> float:
+  date = (item.date_created if isinstance(item, model.Payment)
+      else item.datetime_created)
+  if date.tzinfo is None:
+    date = date.replace(tzinfo=datetime.timezone.utc)
+  return date.timestamp()
+
+
+def _positions(stream: Iterable[Any], sign: int
+    ) -> Iterator[Tuple[float, Item]]:
+  # Lists and tuples are sorted into the merge's order, since some sources
+  # (like `get_transaction_history()`, which is oldest first) don't use the
+  # API's. Lazy streams have to be in that order already; one that isn't
+  # raises rather than silently merging out of order.
+  items = aggregate.iter_items(stream)
+  if isinstance(stream, collections.abc.Sequence):
+    yield from sorted(((sign * _timestamp(item), item) for item in items),
+        key=lambda pair: pair[0])
+    return
+  last = None
+  for item in items:
+    position = sign * _timestamp(item)
+    if last is not None and position < last:
+      order = 'newest' if sign < 0 else 'oldest'
+      raise ValueError(f'Stream is not {order} first at {event_key(item)}; '
+          'pass it as a list to have it sorted')
+    last = position
+    yield position, item
+
+
+def event_key(item: Item) -> Hashable:
+  # A story and the payment it wraps are the same event, so anything with a
+  # payment is keyed on the payment id.
+  if isinstance(item, model.Payment):
+    return ('payment', item.id)
+  if item.payment is not None:
+    return ('payment', item.payment.id)
+  return ('story', item.id)
+
+
+def richness(item: Item) -> Tuple[int, int]:
+  # Stories carry the payment plus funding source and other details, so any
+  # story beats a bare payment; between two of a kind, more populated fields
+  # win.
+  populated = sum(value is not None for value in vars(item).values())
+  return (isinstance(item, model.Transaction), populated)
+
+
+def merge(*streams: Iterable[Any],
+    window: datetime.timedelta = datetime.timedelta(minutes=10),
+    newest_first: bool = True) -> Iterator[Item]:
+  # Merges streams into one chronological stream (newest first by default,
+  # like the API) with every event once. Lazy streams must already be in that
+  # order; lists and tuples are sorted first.
+  # Copies of an event show up in different streams with slightly different
+  # timestamps, so events are held back until the merge is `window` past
+  # them, which is when every copy has arrived; the richest copy is emitted.
+  # Memory is bounded by the window plus the set of ids already emitted.
+  sign = -1 if newest_first else 1
+  window_s = window.total_seconds()
+  keyed = [_positions(stream, sign) for stream in streams]
+  merged = heapq.merge(*keyed, key=lambda pair: pair[0])
+  pending: 'collections.OrderedDict[Hashable, Tuple[float, Item]]' = (
+      collections.OrderedDict())
+  emitted: Set[Hashable] = set()
+  for position, item in merged:
+    while pending:
+      key, (first, kept) = next(iter(pending.items()))
+      if position - first <= window_s:
+        break
+      del pending[key]
+      emitted.add(key)
+      yield kept
+    key = event_key(item)
+    if key in emitted:
+      continue
+    if key not in pending:
+      pending[key] = (position, item)
+    elif richness(item) > richness(pending[key][1]):
+      pending[key] = (pending[key][0], item)
+  yield from (kept for _, kept in pending.values())
@@ -1,9 +1,11 @@
 import datetime
+import decimal
 
 from typing import Union
 
 __all__ = [
-    'canonicalize_date'
+    'canonicalize_date',
+    'to_cents',
 ]
 
 def canonicalize_date(
@@ -11,3 +13,12 @@ def canonicalize_date(
   if isinstance(date_or_str, datetime.date):
     return date_or_str
   return datetime.datetime.strptime(date_or_str, '%Y-%m-%d').date()
+
+def to_cents(amount: Union[str, int, float, decimal.Decimal]) -> int:
+  # Go through `str` so that floats like 0.1 round to the cent they print as.
+  if isinstance(amount, int):
+    return amount * 100
+  if isinstance(amount, str):
+    amount = amount.replace('$', '').replace(',', '').strip()
+  value = decimal.Decimal(str(amount)) * 100
+  return int(value.quantize(decimal.Decimal(1), rounding=decimal.ROUND_HALF_UP))